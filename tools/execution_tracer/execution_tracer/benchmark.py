@@ -0,0 +1,224 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from execution_tracer.execution_tracer_reader import AdditionalDataType, find_llvm_disas
+from execution_tracer.trace_generator import TraceGeneratorConfig, generate_pc2line, generate_trace
+
+DEFAULT_ENTRY_COUNT = 200 * 1000
+DEFAULT_REPEAT = 3
+DEFAULT_MAX_SLOWDOWN = 0.2
+SOURCE_LINE_COUNT = 1000
+
+# Traces covering all kinds of additional data, multiple ISAs, entries with and without opcodes and different PC lengths
+PRESETS = {
+    "pc32": TraceGeneratorConfig(pc_length=4, has_opcodes=False),
+    "pc64": TraceGeneratorConfig(pc_length=8, has_opcodes=False),
+    "opcodes": TraceGeneratorConfig(pc_length=0),
+    "pc32-opcodes": TraceGeneratorConfig(pc_length=4),
+    "pc64-memory": TraceGeneratorConfig(
+        pc_length=8, triple_and_models=("riscv64 rv64imac",), additional_data_types=(AdditionalDataType.MemoryAccess,),
+    ),
+    "pc32-all-data": TraceGeneratorConfig(
+        pc_length=4, triple_and_models=("riscv32 rv32imacv",),
+        additional_data_types=tuple(data_type for data_type in AdditionalDataType if data_type is not AdditionalDataType.Empty),
+    ),
+    "arm-thumb": TraceGeneratorConfig(
+        pc_length=4, triple_and_models=("armv7a cortex-a9", "thumb cortex-a9"),
+        additional_data_types=(AdditionalDataType.MemoryAccess, AdditionalDataType.Registers),
+    ),
+}
+# Disassembling is much slower than anything else, so it's measured on fewer traces
+DISASSEMBLY_PRESETS = ("pc32-opcodes", "arm-thumb")
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    preset: str
+    command: list[str]
+    entry_count: int
+    trace_size: int
+    # Best of all repetitions
+    seconds: float
+    entries_per_second: float
+    megabytes_per_second: float
+    # Highest of all repetitions, None if it can't be measured on this platform
+    peak_rss_kib: Optional[int]
+
+
+def run_reader(arguments: list[str]) -> tuple[float, Optional[int]]:
+    # Runs the reader in a separate process, returns its run time and peak RSS
+    environment = dict(os.environ)
+    package_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, (package_path, environment.get("PYTHONPATH"))))
+    command = [sys.executable, "-m", "execution_tracer.execution_tracer_reader", *arguments]
+
+    start = time.perf_counter()
+    # Errors go to a file rather than a pipe, which would block the reader once full, as it's only read after the process exits
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, env=environment, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        peak_rss = None
+        if hasattr(os, "wait4"):
+            # Resource usage of this process only, `RUSAGE_CHILDREN` would report the maximum of all processes run so far
+            _, status, resource_usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # Linux reports the size in KiB, macOS in bytes
+            peak_rss = resource_usage.ru_maxrss // 1024 if sys.platform == "darwin" else resource_usage.ru_maxrss
+        else:
+            process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Command {' '.join(command)} failed with code {process.returncode}:\n{stderr.decode(errors='replace')}")
+    return seconds, peak_rss
+
+
+def measure(name: str, preset: str, arguments: list[str], entry_count: int, trace_size: int, repeat: int) -> BenchmarkResult:
+    runs = [run_reader(arguments) for _ in range(repeat)]
+    seconds = min(run_seconds for run_seconds, _ in runs)
+    peak_rss = [run_peak_rss for _, run_peak_rss in runs if run_peak_rss is not None]
+    return BenchmarkResult(
+        name, preset, arguments, entry_count, trace_size, seconds,
+        entry_count / seconds, trace_size / seconds / 1e6,
+        max(peak_rss) if peak_rss else None,
+    )
+
+
+def run_benchmarks(work_directory: str, presets: list[str], entry_count: int, repeat: int, llvm_disas_path: Optional[str]) -> list[BenchmarkResult]:
+    results = []
+    for preset in presets:
+        config = dataclasses.replace(PRESETS[preset], entry_count=entry_count)
+        trace_path = os.path.join(work_directory, f"{preset}.bin")
+        with open(trace_path, "wb") as trace_file:
+            generate_trace(trace_file, config)
+        trace_size = os.path.getsize(trace_path)
+
+        def run(name: str, arguments: list[str]) -> None:
+            print(f"Running {name}...", file=sys.stderr)
+            results.append(measure(name, preset, arguments, entry_count, trace_size, repeat))
+
+        run(f"inspect/{preset}", ["inspect", trace_path])
+        if config.pc_length != 0:
+            source_path = os.path.join(work_directory, "source.c")
+            with open(source_path, "w") as source_file:
+                source_file.writelines(f"line {i}\n" for i in range(1, SOURCE_LINE_COUNT + 1))
+            pc2line_path = os.path.join(work_directory, f"{preset}.pc2line")
+            with open(pc2line_path, "w") as pc2line_file:
+                generate_pc2line(pc2line_file, config, source_path, SOURCE_LINE_COUNT)
+            run(f"coverage/{preset}", [
+                "coverage", trace_path, "--pc2line", pc2line_path, "--sources", source_path,
+                "--output", os.path.join(work_directory, f"{preset}.info"),
+            ])
+        if llvm_disas_path is not None and preset in DISASSEMBLY_PRESETS:
+            run(f"disassemble/{preset}", ["inspect", trace_path, "--disassemble", "--llvm-disas-path", llvm_disas_path])
+    return results
+
+
+def find_regressions(results: list[BenchmarkResult], baseline: dict, max_slowdown: float) -> list[str]:
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        if result.name not in baseline_results:
+            continue
+        expected = baseline_results[result.name]["entries_per_second"]
+        if result.entries_per_second < expected * (1 - max_slowdown):
+            regressions.append(f"{result.name}: {result.entries_per_second:.0f} entries/s, baseline {expected:.0f} entries/s")
+    return regressions
+
+
+def handle_generate(args) -> None:
+    config = dataclasses.replace(
+        PRESETS[args.preset],
+        entry_count=args.entries,
+        seed=args.seed,
+    )
+    with open(args.output, "wb") as file:
+        generate_trace(file, config)
+
+
+def handle_run(args) -> None:
+    llvm_disas_path = args.llvm_disas_path
+    if llvm_disas_path is None:
+        try:
+            llvm_disas_path = find_llvm_disas()
+        except FileNotFoundError:
+            print("libllvm-disas wasn't found, skipping disassembly benchmarks", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        work_directory = args.work_directory or temporary_directory
+        os.makedirs(work_directory, exist_ok=True)
+        results = run_benchmarks(work_directory, args.preset or list(PRESETS), args.entries, args.repeat, llvm_disas_path)
+
+    for result in results:
+        peak_rss = "-" if result.peak_rss_kib is None else f"{result.peak_rss_kib / 1024:.1f} MiB"
+        print(f"{result.name:<28} {result.entries_per_second:>12.0f} entries/s {result.megabytes_per_second:>8.2f} MB/s  peak RSS {peak_rss}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [dataclasses.asdict(result) for result in results],
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.max_slowdown)
+        if regressions:
+            print("Throughput regressed by more than {:.0%}:".format(args.max_slowdown), file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of Renode's ExecutionTracer binary format reader")
+    subparsers = parser.add_subparsers(title='subcommands', dest='subcommands', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='Generate a synthetic trace')
+    generate_parser.add_argument("output", type=str, help="path to the generated trace")
+    generate_parser.add_argument("--preset", default="pc32-all-data", choices=PRESETS.keys(), help="kind of the generated trace")
+    generate_parser.add_argument("--entries", default=DEFAULT_ENTRY_COUNT, type=int, help="number of entries")
+    generate_parser.add_argument("--seed", default=0, type=int, help="seed of the random number generator")
+
+    run_parser = subparsers.add_parser('run', help='Measure the reader on synthetic traces')
+    run_parser.add_argument("--output", default=None, type=str, help="path to a JSON file with the results")
+    run_parser.add_argument("--preset", default=None, action="append", choices=PRESETS.keys(),
+        help="kind of traces to measure, can be specified multiple times, all of them by default")
+    run_parser.add_argument("--entries", default=DEFAULT_ENTRY_COUNT, type=int, help="number of entries of each trace")
+    run_parser.add_argument("--repeat", default=DEFAULT_REPEAT, type=int, help="number of runs of each benchmark, the fastest one is reported")
+    run_parser.add_argument("--llvm-disas-path", default=None, help="path to libllvm-disas library, without it the library is searched for")
+    run_parser.add_argument("--work-directory", default=None, type=str, help="directory to keep generated traces in, a temporary one by default")
+    run_parser.add_argument("--baseline", default=None, type=str,
+        help="JSON file with results of a previous run, exit with an error if throughput of any benchmark regressed")
+    run_parser.add_argument("--max-slowdown", default=DEFAULT_MAX_SLOWDOWN, type=float,
+        help="fraction of the baseline throughput a benchmark can lose before it's reported as a regression")
+
+    args = parser.parse_args()
+    if args.subcommands == 'generate':
+        handle_generate(args)
+    elif args.subcommands == 'run':
+        handle_run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -44,3 +44,34 @@ class PathSubstitution:
 
 def apply_path_substitutions(code_filename: str, substitute_paths: Iterable[PathSubstitution]) -> str:
     return functools.reduce(lambda p, sub: sub.apply(p), substitute_paths, code_filename)
+
+def parse_address_range(s: str) -> tuple[int, int]:
+    # Range in the start:end format, with the end address excluded
+    args = s.split(':')
+    if len(args) != 2:
+        raise ValueError('Address range should be in start:end format')
+    low, high = (int(arg, 0) for arg in args)
+    if low >= high:
+        raise ValueError('Start of an address range has to be lower than its end')
+    return low, high
+
+def parse_entry_window(s: str) -> tuple[int, int]:
+    # Number of the first entry and the number of entries in the start:count format
+    args = s.split(':')
+    if len(args) != 2:
+        raise ValueError('Entry window should be in start:count format')
+    start, count = (int(arg, 0) for arg in args)
+    if start < 0 or count <= 0:
+        raise ValueError('Start of an entry window can\'t be negative and its length has to be positive')
+    return start, count
+
+def parse_opcode_mask(s: str) -> tuple[int, int]:
+    # Opcode value and mask in the value/mask format, without the mask the whole opcode is compared
+    args = s.split('/')
+    if len(args) > 2:
+        raise ValueError('Opcode mask should be in value/mask format')
+    value = int(args[0], 0)
+    mask = int(args[1], 0) if len(args) == 2 else -1
+    if value & ~mask:
+        raise ValueError('Opcode value has bits set outside of the mask')
+    return value, mask
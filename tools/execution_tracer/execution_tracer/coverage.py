@@ -7,28 +7,39 @@
 from __future__ import annotations
 
 import os
+import bisect
+import heapq
 import itertools
 import functools
 import sys
+import time
 import typing
-from collections import defaultdict
+from array import array
+from collections import Counter, defaultdict
 from dataclasses import dataclass, astuple, field
-from typing import TYPE_CHECKING, BinaryIO, TextIO, Generator, Iterable, IO, NamedTuple, Optional
+from typing import TYPE_CHECKING, BinaryIO, TextIO, Generator, Iterable, IO, NamedTuple, Optional, Sequence
 from elftools.common.utils import bytes2str
 from elftools.elf.elffile import ELFFile
 
+try:
+    # Optional, only speeds up counting executions of addresses
+    import numpy
+except ImportError:
+    numpy = None
+
 from execution_tracer.common_utils import extract_common_prefix, remove_prefix, PathSubstitution, apply_path_substitutions
 import execution_tracer.dwarf as dwarf
 import execution_tracer.pc2line as pc2line
 
 if TYPE_CHECKING:
-    from execution_tracer_reader import TraceData # type: ignore
+    from execution_tracer_reader import TraceChunk, TraceData # type: ignore
     from elftools.elf.elffile import DWARFInfo
     from elftools.dwarf.compileunit import CompileUnit
     from elftools.dwarf.lineprogram import LineProgramEntry
 
 @dataclass
 class AddressRange:
+    __slots__ = ("low", "high")
     low: int
     high: int
 
@@ -37,14 +48,19 @@ class AddressRange:
 
 
 class CodeLine:
+    # There's a CodeLine for every line of each source file, so they are kept small
+    __slots__ = ("content", "number", "filename", "addresses", "is_exec", "executions", "labels")
+
     def __init__(self, content: Optional[str], number: int, filename: str, is_exec: bool) -> None:
         self.content = content
         self.number = number
         self.filename = filename
         self.addresses: list[AddressRange] = []
         self.is_exec = is_exec
-        self.address_counter = defaultdict(lambda: ExecutionCount())
-        self.labels = set()
+        # The highest number of executions of any of the line's addresses, updated from `AddressExecutions`
+        self.executions = 0
+        # Labels of traces executing the line in the order they were added, only allocated for executed lines
+        self.labels: Optional[dict[str, None]] = None
 
     def add_address(self, low: int, high: int) -> None:
         # Try simply merge ranges if they are continuous.
@@ -54,20 +70,19 @@ class CodeLine:
         else:
             self.addresses.append(AddressRange(low, high))
 
-    def count_execution(self, address, label):
-        self.address_counter[address].count_up()
-        self.labels.add(label)
+    def add_label(self, label: str) -> None:
+        if self.labels is None:
+            self.labels = {}
+        self.labels[label] = None
 
     def most_executions(self) -> int:
-        if len(self.address_counter) == 0:
-            return 0
-        return max(count.count for count in self.address_counter.values())
+        return self.executions
 
     def to_lcov_format(self) -> str:
         return f"DA:{self.number},{self.most_executions()}"
 
     def to_desc_format(self) -> str:
-        return f"TEST:{self.number},{';'.join(self.labels)}"
+        return f"TEST:{self.number},{';'.join(self.labels or ())}"
 
 
 class Record:
@@ -94,12 +109,185 @@ class Record:
         yield from (l.to_desc_format() for l in self.get_exec_lines() if l.most_executions() > 0)
         yield 'end_of_record'
 
-class ExecutionCount:
+class AddressLineIndex:
+    """
+    Maps addresses to code lines, as sorted and non-overlapping address ranges.
+
+    Memory usage is proportional to the number of address ranges of code lines, not to the size of the code.
+    If an address is mapped to several lines, the last one is used.
+    """
+    def __init__(self, code_lines: Iterable[CodeLine]):
+        self.lines: list[CodeLine] = []
+        ranges: list[tuple[int, int, int]] = []
+        for line in code_lines:
+            ranges.extend((address.low, address.high, len(self.lines)) for address in line.addresses if address.low < address.high)
+            self.lines.append(line)
+        ranges.sort()
+
+        self.low = array("Q")
+        self.high = array("Q")
+        self.line_ids = array("L")
+        # Sweep over boundaries of all ranges, the range of the last line wins between each two of them
+        boundaries = sorted({address for low, high, _ in ranges for address in (low, high)})
+        active: list[tuple[int, int]] = []
+        next_range = 0
+        for low, high in zip(boundaries, boundaries[1:]):
+            while next_range < len(ranges) and ranges[next_range][0] <= low:
+                _, range_high, line_id = ranges[next_range]
+                heapq.heappush(active, (-line_id, range_high))
+                next_range += 1
+            # Ranges are removed only once they end up on top of the heap
+            while active and active[0][1] <= low:
+                heapq.heappop(active)
+            if not active:
+                continue
+            line_id = -active[0][0]
+            if self.high and self.high[-1] == low and self.line_ids[-1] == line_id:
+                self.high[-1] = high
+            else:
+                self.low.append(low)
+                self.high.append(high)
+                self.line_ids.append(line_id)
+
+    def find_line_id(self, address: int) -> int:
+        # Returns the index of the line in `lines` or -1 if the address isn't mapped to any line
+        i = bisect.bisect_right(self.low, address) - 1
+        if i >= 0 and address < self.high[i]:
+            return self.line_ids[i]
+        return -1
+
+    def find_line(self, address: int) -> Optional[CodeLine]:
+        line_id = self.find_line_id(address)
+        return self.lines[line_id] if line_id >= 0 else None
+
+
+class AddressExecutions:
+    """
+    Executions of addresses in all traces, with ids of lines the addresses belong to, in arrays sorted by the address.
+
+    There are no Python objects per address. The highest number of executions of each line is reduced from the arrays.
+    """
     def __init__(self):
-        self.count = 0
+        self.address = array("Q")
+        self.count = array("Q")
+        self.line_id = array("L")
+
+    def add(self, address: array, count: array, line_id: array) -> None:
+        # `address` has to be sorted and without duplicates, executions of addresses added before are summed up
+        if not self.address:
+            self.address, self.count, self.line_id = array("Q", address), array("Q", count), array("L", line_id)
+            return
+        if numpy is not None:
+            addresses = numpy.concatenate((numpy.frombuffer(self.address, dtype=numpy.uint64), numpy.frombuffer(address, dtype=numpy.uint64)))
+            order = numpy.argsort(addresses, kind="stable")
+            addresses = addresses[order]
+            starts = numpy.flatnonzero(numpy.concatenate(([True], addresses[1:] != addresses[:-1])))
+            counts = numpy.concatenate((numpy.frombuffer(self.count, dtype=numpy.uint64), numpy.frombuffer(count, dtype=numpy.uint64)))
+            line_ids = numpy.concatenate((numpy.frombuffer(self.line_id, dtype=f"u{self.line_id.itemsize}"), numpy.frombuffer(line_id, dtype=f"u{line_id.itemsize}")))
+            self.address = array("Q", addresses[starts].tobytes())
+            self.count = array("Q", numpy.add.reduceat(counts[order], starts).astype(numpy.uint64).tobytes())
+            self.line_id = array("L", line_ids[order][starts].astype(f"u{self.line_id.itemsize}").tobytes())
+            return
+
+        merged_address, merged_count, merged_line_id = array("Q"), array("Q"), array("L")
+        i = 0
+        for new_address, new_count, new_line_id in zip(address, count, line_id):
+            # Addresses added before are copied in slices up to the new one
+            j = bisect.bisect_left(self.address, new_address, i)
+            merged_address.extend(self.address[i:j])
+            merged_count.extend(self.count[i:j])
+            merged_line_id.extend(self.line_id[i:j])
+            i = j
+            if i < len(self.address) and self.address[i] == new_address:
+                new_count += self.count[i]
+                i += 1
+            merged_address.append(new_address)
+            merged_count.append(new_count)
+            merged_line_id.append(new_line_id)
+        merged_address.extend(self.address[i:])
+        merged_count.extend(self.count[i:])
+        merged_line_id.extend(self.line_id[i:])
+        self.address, self.count, self.line_id = merged_address, merged_count, merged_line_id
+
+    def get_line_executions(self, line_count: int) -> Sequence[int]:
+        # The highest number of executions of any address of each line
+        if numpy is not None:
+            line_executions = numpy.zeros(line_count, dtype=numpy.uint64)
+            numpy.maximum.at(
+                line_executions,
+                numpy.frombuffer(self.line_id, dtype=f"u{self.line_id.itemsize}").astype(numpy.intp),
+                numpy.frombuffer(self.count, dtype=numpy.uint64),
+            )
+            return line_executions.tolist()
+        line_executions = array("Q", bytes(8 * line_count))
+        for line_id, count in zip(self.line_id, self.count):
+            if count > line_executions[line_id]:
+                line_executions[line_id] = count
+        return line_executions
+
+
+# Minimal time between snapshots of the report, in seconds
+DEFAULT_SNAPSHOT_INTERVAL = 10.0
 
-    def count_up(self) -> None:
-        self.count += 1
+
+# Number of PCs collapsed to unique addresses at once when counting with NumPy
+COUNT_BATCH_LENGTH = 1024 * 1024
+
+
+class AddressCounter:
+    """
+    Counts executions of unique addresses in PCs of chunks.
+
+    With NumPy, batches of PCs are collapsed with `numpy.unique` and merged with the counts so far,
+    so that no Python code runs per executed instruction. Otherwise PCs are counted with a `Counter`.
+    """
+    def __init__(self):
+        self._counts: Counter[int] = Counter()
+        self._pending: list = []
+        self._pending_length = 0
+        if numpy is not None:
+            self._unique_addresses = numpy.empty(0, dtype=numpy.uint64)
+            self._unique_counts = numpy.empty(0, dtype=numpy.int64)
+
+    def update(self, pcs: array) -> None:
+        if numpy is None:
+            self._counts.update(pcs)
+            return
+        # Chunks may share memory with the trace data, so PCs are copied
+        self._pending.append(numpy.frombuffer(pcs, dtype=f"u{pcs.itemsize}").copy())
+        self._pending_length += len(pcs)
+        if self._pending_length >= COUNT_BATCH_LENGTH:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        addresses, counts = numpy.unique(numpy.concatenate(self._pending), return_counts=True)
+        self._pending = []
+        self._pending_length = 0
+        addresses, indices = numpy.unique(numpy.concatenate((self._unique_addresses, addresses)), return_inverse=True)
+        merged_counts = numpy.zeros(len(addresses), dtype=numpy.int64)
+        numpy.add.at(merged_counts, indices, numpy.concatenate((self._unique_counts, counts)))
+        self._unique_addresses = addresses
+        self._unique_counts = merged_counts
+
+    def get_counts(self) -> Counter[int]:
+        if numpy is not None:
+            self._flush()
+            return Counter(dict(zip(self._unique_addresses.tolist(), self._unique_counts.tolist())))
+        return self._counts
+
+
+def count_addresses(trace_data: 'TraceData') -> Counter[int]:
+    # Number of executions of each address present in the trace
+    return count_chunk_addresses(trace_data, trace_data.iter_chunks())
+
+
+def count_chunk_addresses(trace_data: 'TraceData', chunks: Iterable['TraceChunk']) -> Counter[int]:
+    address_counter = AddressCounter()
+    for chunk in chunks:
+        address_counter.update(chunk.pc)
+    return address_counter.get_counts()
 
 
 @dataclass
@@ -113,17 +301,30 @@ class Coverage:
     print_unmatched_address: bool = False
     debug: bool = False
     noisy: bool = False
+    # Deprecated and ignored, addresses are always mapped to lines with `AddressLineIndex`, which is small enough for big programs
     lazy_line_cache: bool = False
     load_whole_code_lines: bool = True
+    # Number of processes extracting line tables from DWARF data
+    jobs: int = 1
+    # Directory where line tables extracted from DWARF data are cached, they aren't cached if it's None
+    line_table_cache_directory: Optional[str] = None
 
     _code_files: list[IO] = field(init=False)
+    _line_index: Optional[AddressLineIndex] = field(init=False, default=None)
+    _address_executions: AddressExecutions = field(init=False, default_factory=AddressExecutions)
 
     def __post_init__(self):
         assert self.elf_file_handler or self.pc2line_file_stream
+        if self.lazy_line_cache:
+            print("The lazy line cache is deprecated and has no effect, addresses are mapped to lines with an index of address ranges", file=sys.stderr)
+        if self.elf_file_handler:
+            line_table = dwarf.get_line_table(
+                self.elf_file_handler, jobs=self.jobs, cache_directory=self.line_table_cache_directory, debug=self.debug, noisy=self.noisy,
+            )
         if not self.code_filenames:
             print("No sources provided, will attempt to discover automatically")
             if self.elf_file_handler:
-                self._code_files = dwarf.find_code_files(dwarf.get_dwarf_info(self.elf_file_handler), self.substitute_paths, self.ignore_paths)
+                self._code_files = dwarf.find_code_files(line_table, self.substitute_paths, self.ignore_paths)
             if self.pc2line_file_stream:
                 self._code_files = pc2line.find_code_files(self.pc2line_file_stream, self.substitute_paths)
             self.code_filenames = [apply_path_substitutions(code_filename.name, self.substitute_paths) for code_filename in self._code_files]
@@ -131,8 +332,7 @@ class Coverage:
             self._code_files = [open(file) for file in self.code_filenames]
 
         if self.elf_file_handler:
-            dwarf_info = dwarf.get_dwarf_info(self.elf_file_handler)
-            self.files_low_address, self.files_high_address, self.code_lines = self._get_code_lines_by_file_from_dwarf(dwarf_info)
+            self.files_low_address, self.files_high_address, self.code_lines = self._get_code_lines_by_file_from_dwarf(line_table)
         if self.pc2line_file_stream:
             self.files_low_address, self.files_high_address, self.code_lines = self._get_code_lines_by_file_from_pc2line(self.pc2line_file_stream)
 
@@ -146,24 +346,6 @@ class Coverage:
                 return file
         return None
 
-    def _build_addr_map(self, code_lines_with_address: list[CodeLine], pc_length: int) -> dict[bytes, CodeLine]:
-        # This is a dictionary of references, that will be used to quickly update counters for each code line.
-        # We can walk only once over all code lines and pre-generate mappings between PCs (addresses) and code lines.
-        # This way, when we'll later parse the trace, all we do are quick look-ups into this dictionary to get relevant code line by address.
-        address_count_cache: dict[bytes, CodeLine] = {}
-
-        for line in code_lines_with_address:
-            for addr in line.addresses:
-                addr_lo = addr.low
-                while addr_lo < addr.high:
-                    if not addr_lo in address_count_cache:
-                        address_count_cache[addr_lo.to_bytes(pc_length, byteorder='little', signed=False)] = line
-                    else:
-                        print(f'Address {addr_lo} is already mapped to another line. Ignoring this time')
-                    # This is a naive approach. If memory usage is of greater concern, find a better way to store ranges
-                    addr_lo += 1
-        return address_count_cache
-
     def _build_code_lines_dict(self) -> dict[str, list[CodeLine]]:
         code_lines: dict[str, list[CodeLine]] = defaultdict(list)
         for code_file in self._code_files:
@@ -175,13 +357,13 @@ class Coverage:
     
     # Get list of code lines, grouped by the file where they belong
     # Result is a tuple: lowest address in the binary, highest address in the binary, and a dictionary of code lines
-    def _get_code_lines_by_file_from_dwarf(self, dwarf_info: 'DWARFInfo') -> tuple[int, int, dict[str, list[CodeLine]]]:
+    def _get_code_lines_by_file_from_dwarf(self, line_table: dwarf.LineTable) -> tuple[int, int, dict[str, list[CodeLine]]]:
         code_lines: dict[str, list[CodeLine]] = self._build_code_lines_dict()
 
         # The lowest and highest interesting (corresponding to our sources' files) addresses, respectively
         files_low_address = None
         files_high_address = 0
-        for file_name, file_path, line_number, address_low, address_high in dwarf.get_addresses(dwarf_info, debug=self.debug, noisy=self.noisy):
+        for file_name, file_path, line_number, address_low, address_high in line_table:
             file_full_name = os.path.join(file_path, file_name)
             file_full_name = apply_path_substitutions(file_full_name, self.substitute_paths)
             # If the files are provided by hand, patch their names
@@ -252,53 +434,67 @@ class Coverage:
         if not trace_data.has_pc:
             raise ValueError("The trace data doesn't contain PCs.")
 
-        # Note, that this is just a cache to `code_lines`
-        # but after eliminating lines that don't correspond to any address
-        code_lines_with_address: list[CodeLine] = []
-        for file_name in self.code_lines.keys():
-            code_lines_with_address.extend(line for line in self.code_lines[file_name] if line.addresses)
+        # This step takes some time for large traces and codebases, let's advise the user to wait
+        print(f'Processing trace file {trace_data.file.name}, please wait...')
+        self.aggregate_address_counts(count_addresses(trace_data), trace_data.filename)
 
-        # This is also a cache to CodeLines
-        address_count_cache: dict[bytes, CodeLine] = {}
-        unmatched_address: set[int] = set()
+    def aggregate_coverage_snapshots(self, trace_data: 'TraceData', snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL) -> Generator[None, None, None]:
+        # Aggregates coverage of a trace that is still being written. Yields each time executions counted so far are aggregated,
+        # at most every `snapshot_interval` seconds, so that a snapshot of the report can be written.
+        if not trace_data.has_pc:
+            raise ValueError("The trace data doesn't contain PCs.")
 
-        if not self.lazy_line_cache:
+        print(f'Following trace file {trace_data.file.name}...')
+        address_counter = AddressCounter()
+        last_snapshot = time.monotonic()
+        try:
+            for chunk in trace_data.iter_chunks():
+                address_counter.update(chunk.pc)
+                if time.monotonic() - last_snapshot >= snapshot_interval:
+                    self.aggregate_address_counts(address_counter.get_counts(), trace_data.filename)
+                    address_counter = AddressCounter()
+                    yield
+                    last_snapshot = time.monotonic()
+        except KeyboardInterrupt:
+            # Interrupting is the only way to stop following without a timeout, the report of the part processed so far is still created
+            print(f'Stopped following trace file {trace_data.file.name}')
+        self.aggregate_address_counts(address_counter.get_counts(), trace_data.filename)
+
+    def aggregate_address_counts(self, address_counts: Counter[int], label: str):
+        # The index is built once and shared by all traces
+        if self._line_index is None:
             print('Populating address cache...')
-            address_count_cache = self._build_addr_map(code_lines_with_address, trace_data.pc_length)
-
-        # This step takes some time for large traces and codebases, let's advise the user to wait
-        print(f'Processing trace file {trace_data.file.name}, please wait...')
-        for address_bytes, _, _, _ in trace_data:
-            if address_bytes in address_count_cache:
-                address_count_cache[address_bytes].count_execution(address_bytes, trace_data.filename)
-            else:
-                address = int.from_bytes(address_bytes, byteorder="little", signed=False)
-                if address in unmatched_address:
-                    # Is marked as unmatched, short cut!
-                    # For unmatched address, a walk over all lines is very slow, since we need to check the entire map each time
-                    # So make sure that we mark the address as "unmatched" on the first try, and don't care about it later on
-                    continue
-                # Optimization: cut-off addresses from trace that for sure don't matter to us
-                if not (self.files_low_address <= address < self.files_high_address):
-                    unmatched_address.add(address)
-                    continue
-                if self.debug and self.noisy:
-                    print(f'parsing new addr in trace: {address:x}')
-                # Find a line, for which one of the addresses matches with the address bytes present in the trace
-                # If we pre-generated the mappings earlier (in `_build_addr_map`), this function will only serve as a back-up to find not matched addresses
-                # Walking each time is slow, so it's generally better to pre-generate mappings, if we aren't running out of memory
-                for line in code_lines_with_address:
-                    if any(
-                        # Check for all address ranges
-                        address_range.low <= address < address_range.high
-                        for address_range in line.addresses
-                    ):
-                        # One line is likely to exist at several addresses
-                        line.count_execution(address_bytes, trace_data.filename)
-                        address_count_cache[address_bytes] = line
-                        break
-                if address_bytes not in address_count_cache:
-                    unmatched_address.add(address)
+            self._line_index = AddressLineIndex(
+                line for file_name in self.code_lines.keys() for line in self.code_lines[file_name] if line.addresses
+            )
+        lines = self._line_index.lines
+        find_line_id = self._line_index.find_line_id
+        unmatched_address: set[int] = set()
+        address = array("Q")
+        count = array("Q")
+        line_id = array("L")
+
+        # Each unique address is processed once, with the number of its executions in the trace
+        for trace_address in sorted(address_counts):
+            # Optimization: cut-off addresses from trace that for sure don't matter to us
+            if not (self.files_low_address <= trace_address < self.files_high_address):
+                unmatched_address.add(trace_address)
+                continue
+            trace_line_id = find_line_id(trace_address)
+            if trace_line_id < 0:
+                unmatched_address.add(trace_address)
+                continue
+            if self.debug and self.noisy:
+                print(f'parsing new addr in trace: {trace_address:x}')
+            address.append(trace_address)
+            count.append(address_counts[trace_address])
+            line_id.append(trace_line_id)
+            # One line is likely to exist at several addresses
+            lines[trace_line_id].add_label(label)
+
+        self._address_executions.add(address, count, line_id)
+        for line, executions in zip(lines, self._address_executions.get_line_executions(len(lines))):
+            line.executions = executions
 
         if self.print_unmatched_address:
             print(f'Found {len(unmatched_address)} unmatched unique addresses')
@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+import sqlite3
+from collections import Counter
+from typing import BinaryIO, Iterable, Iterator, Optional, TextIO
+
+import execution_tracer.dwarf as dwarf
+
+DATABASE_VERSION = 1
+# Time to wait for other processes, e.g. parallel CI jobs, to finish writing to the database, in seconds
+DATABASE_TIMEOUT = 60.0
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    binary TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    -- Identifies the trace, the absolute path of the trace file unless a label was given explicitly
+    trace TEXT NOT NULL,
+    -- Label of the trace in reports
+    label TEXT NOT NULL,
+    UNIQUE (binary, test_name, trace)
+);
+CREATE TABLE IF NOT EXISTS executions (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    address INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (run_id, address)
+) WITHOUT ROWID;
+"""
+
+
+# SQLite integers are signed, addresses above 2^63 are stored as negative numbers
+def _to_stored_address(address: int) -> int:
+    return address - (1 << 64) if address >= (1 << 63) else address
+
+
+def _from_stored_address(address: int) -> int:
+    return address + (1 << 64) if address < 0 else address
+
+
+def _get_uri(path: str, read_only: bool) -> str:
+    uri = pathlib.Path(os.path.abspath(path)).as_uri()
+    return uri + "?mode=ro" if read_only else uri
+
+
+def get_binary_key(elf_file_handler: Optional[BinaryIO], pc2line_file_stream: Optional[TextIO]) -> str:
+    # Runs are only merged with ones for the same binary, so that addresses refer to the same code
+    if elf_file_handler:
+        return dwarf.get_elf_key(elf_file_handler)
+    digest = hashlib.sha256()
+    for line in pc2line_file_stream:
+        digest.update(line.encode())
+    pc2line_file_stream.seek(0)
+    return f"pc2line-sha256-{digest.hexdigest()}"
+
+
+class CoverageDatabase:
+    """
+    SQLite database with the number of executions of each address in traces, so that coverage reports
+    of many traces can be created without decoding the traces again.
+
+    Each trace is stored as a run, identified by the binary, the test name and the trace.
+    Runs that are already in the database are only replaced if it's explicitly requested.
+    """
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        try:
+            self._connection = sqlite3.connect(_get_uri(path, read_only), uri=True, timeout=DATABASE_TIMEOUT)
+        except sqlite3.Error as e:
+            raise ValueError(f"Coverage database {path} can't be opened: {e}")
+        try:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0 and not read_only:
+                with self._connection:
+                    self._connection.executescript(SCHEMA)
+                    self._connection.execute(f"PRAGMA user_version = {DATABASE_VERSION}")
+            elif version == 0:
+                raise ValueError(f"{path} isn't a coverage database")
+            elif version != DATABASE_VERSION:
+                raise ValueError(f"Unsupported coverage database version {version} of {path}, expected {DATABASE_VERSION}")
+            self._connection.execute("PRAGMA foreign_keys = ON")
+        except sqlite3.DatabaseError as e:
+            self._connection.close()
+            raise ValueError(f"{path} isn't a coverage database: {e}")
+        except ValueError:
+            self._connection.close()
+            raise
+
+    def __enter__(self) -> CoverageDatabase:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def find_existing_runs(self, binary: str, test_name: str, traces: Iterable[str]) -> list[str]:
+        return [
+            trace for trace in traces
+            if self._connection.execute(
+                "SELECT 1 FROM runs WHERE binary = ? AND test_name = ? AND trace = ?", (binary, test_name, trace)
+            ).fetchone() is not None
+        ]
+
+    def add_run(self, binary: str, test_name: str, trace: str, label: str, address_counts: Counter[int], replace: bool = False) -> None:
+        with self._connection:
+            if not replace and self.find_existing_runs(binary, test_name, [trace]):
+                raise ValueError(f"Trace {trace} of the test '{test_name}' is already in the database {self.path}")
+            self._connection.execute("DELETE FROM runs WHERE binary = ? AND test_name = ? AND trace = ?", (binary, test_name, trace))
+            run_id = self._connection.execute(
+                "INSERT INTO runs (binary, test_name, trace, label) VALUES (?, ?, ?, ?)", (binary, test_name, trace, label)
+            ).lastrowid
+            self._connection.executemany(
+                "INSERT INTO executions (run_id, address, count) VALUES (?, ?, ?)",
+                ((run_id, _to_stored_address(address), count) for address, count in address_counts.items()),
+            )
+
+    def iter_runs(self, binary: str, test_name: str) -> Iterator[tuple[str, Counter[int]]]:
+        # Yields labels of runs and the number of executions of each address, in the order the runs were added
+        runs = self._connection.execute(
+            "SELECT id, label FROM runs WHERE binary = ? AND test_name = ? ORDER BY id", (binary, test_name)
+        ).fetchall()
+        for run_id, label in runs:
+            executions = self._connection.execute("SELECT address, count FROM executions WHERE run_id = ?", (run_id,))
+            yield label, Counter({_from_stored_address(address): count for address, count in executions})
+
+    def merge(self, path: str, replace: bool = False) -> int:
+        # Copies all runs of another database, which is only read; returns the number of copied runs
+        if os.path.exists(self.path) and os.path.samefile(path, self.path):
+            raise ValueError(f"Coverage database {path} can't be merged into itself")
+        CoverageDatabase(path, read_only=True).close()
+        self._connection.execute("ATTACH DATABASE ? AS other", (_get_uri(path, read_only=True),))
+        try:
+            with self._connection:
+                if not replace:
+                    existing = self._connection.execute(
+                        "SELECT other.runs.trace, other.runs.test_name FROM other.runs JOIN main.runs USING (binary, test_name, trace)"
+                    ).fetchall()
+                    if existing:
+                        trace, test_name = existing[0]
+                        raise ValueError(
+                            f"{len(existing)} runs of {path} are already in the database {self.path}, e.g. trace {trace} of the test '{test_name}'"
+                        )
+                runs = self._connection.execute("SELECT id, binary, test_name, trace, label FROM other.runs ORDER BY id").fetchall()
+                for other_run_id, binary, test_name, trace, label in runs:
+                    self._connection.execute("DELETE FROM runs WHERE binary = ? AND test_name = ? AND trace = ?", (binary, test_name, trace))
+                    run_id = self._connection.execute(
+                        "INSERT INTO runs (binary, test_name, trace, label) VALUES (?, ?, ?, ?)", (binary, test_name, trace, label)
+                    ).lastrowid
+                    self._connection.execute(
+                        "INSERT INTO executions (run_id, address, count) SELECT ?, address, count FROM other.executions WHERE run_id = ?",
+                        (run_id, other_run_id),
+                    )
+        finally:
+            self._connection.execute("DETACH DATABASE other")
+        return len(runs)
@@ -0,0 +1,220 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import gzip
+import io
+import queue
+import threading
+from enum import Enum
+from typing import BinaryIO, Optional, Union
+
+# Size of buffers passed from the decompressing thread to the reader
+DECOMPRESSED_BUFFER_SIZE = 4 * 1024 * 1024
+# Number of decompressed buffers waiting for the reader, limits memory usage if decoding is slower than decompression
+DECOMPRESSED_QUEUE_SIZE = 4
+
+
+class Compression(Enum):
+    NONE = 0
+    GZIP = 1
+    ZSTD = 2
+    LZ4 = 3
+
+
+COMPRESSION_MAGIC = {
+    Compression.GZIP: b"\x1f\x8b",
+    Compression.ZSTD: b"\x28\xb5\x2f\xfd",
+    Compression.LZ4: b"\x04\x22\x4d\x18",
+}
+
+COMPRESSION_EXTENSIONS = {
+    ".gz": Compression.GZIP,
+    ".zst": Compression.ZSTD,
+    ".zstd": Compression.ZSTD,
+    ".lz4": Compression.LZ4,
+}
+
+
+def detect_compression(path: str) -> Compression:
+    with open(path, "rb") as file:
+        magic = file.read(max(len(magic) for magic in COMPRESSION_MAGIC.values()))
+    for compression, compression_magic in COMPRESSION_MAGIC.items():
+        if magic.startswith(compression_magic):
+            return compression
+    return Compression.NONE
+
+
+def open_decompressed(path: str, compression: Compression) -> BinaryIO:
+    if compression == Compression.GZIP:
+        return gzip.open(path, "rb")
+    if compression == Compression.ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError(f"Reading zstd compressed trace {path} requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    if compression == Compression.LZ4:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise RuntimeError(f"Reading lz4 compressed trace {path} requires the 'lz4' package")
+        return lz4.frame.open(path, "rb")
+    return open(path, "rb")
+
+
+def open_compressed_output(path: str, compression: Compression) -> BinaryIO:
+    if compression == Compression.GZIP:
+        # Level of the gzip command, the module's default is much slower for little gain
+        return gzip.open(path, "wb", compresslevel=6)
+    if compression == Compression.ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError(f"Writing zstd compressed file {path} requires the 'zstandard' package")
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+    if compression == Compression.LZ4:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise RuntimeError(f"Writing lz4 compressed file {path} requires the 'lz4' package")
+        return lz4.frame.open(path, "wb")
+    return open(path, "wb")
+
+
+class PipelinedDecompressor(io.RawIOBase):
+    """
+    Read-only stream of decompressed data, which is decompressed on a background thread.
+
+    Decompressed data is passed to the reader through a bounded queue in large buffers.
+    Decompressors release the GIL, so decompression runs in parallel with decoding of the trace.
+    Seeking backwards restarts decompression from the beginning of the file.
+    """
+    def __init__(self, path: str, compression: Compression, buffer_size: int = DECOMPRESSED_BUFFER_SIZE,
+                 queue_size: int = DECOMPRESSED_QUEUE_SIZE):
+        super().__init__()
+        self.name = path
+        self.compression = compression
+        self._buffer_size = buffer_size
+        self._queue_size = queue_size
+        self._thread: Optional[threading.Thread] = None
+        self._start()
+
+    def _start(self) -> None:
+        self._stop = threading.Event()
+        self._buffers: queue.Queue[Union[bytes, BaseException]] = queue.Queue(maxsize=self._queue_size)
+        self._thread = threading.Thread(target=self._decompress, args=(self._buffers, self._stop), daemon=True)
+        self._thread.start()
+        self._current = b""
+        self._current_position = 0
+        self._position = 0
+        self._end_of_file = False
+
+    def _terminate(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _decompress(self, buffers: queue.Queue, stop: threading.Event) -> None:
+        try:
+            with open_decompressed(self.name, self.compression) as file:
+                while not stop.is_set():
+                    data = file.read(self._buffer_size)
+                    self._put(buffers, stop, data)
+                    if not data:
+                        return
+        except Exception as err:
+            # Errors are raised in the reader's thread
+            self._put(buffers, stop, err)
+
+    @staticmethod
+    def _put(buffers: queue.Queue, stop: threading.Event, item: Union[bytes, BaseException]) -> None:
+        # The reader can stop consuming buffers at any time, so the thread can't block forever on a full queue
+        while not stop.is_set():
+            try:
+                buffers.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _next_buffer(self) -> bool:
+        if self._end_of_file:
+            return False
+        item = self._buffers.get()
+        if isinstance(item, BaseException):
+            self._end_of_file = True
+            raise item
+        if not item:
+            self._end_of_file = True
+            return False
+        self._current = item
+        self._current_position = 0
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if size is None or size < 0:
+            return self.readall()
+        parts = []
+        while size > 0:
+            if self._current_position == len(self._current) and not self._next_buffer():
+                break
+            # Whole buffers are returned without copying them
+            if self._current_position == 0 and size >= len(self._current):
+                data = self._current
+            else:
+                data = self._current[self._current_position:self._current_position + size]
+            self._current_position += len(data)
+            self._position += len(data)
+            size -= len(data)
+            parts.append(data)
+        return parts[0] if len(parts) == 1 else b"".join(parts)
+
+    def readall(self) -> bytes:
+        parts = []
+        while True:
+            data = self.read(self._buffer_size)
+            if not data:
+                return b"".join(parts)
+            parts.append(data)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Seeking relative to the end of a compressed trace is not supported")
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        if offset < self._position:
+            self._terminate()
+            self._start()
+        while self._position < offset:
+            if not self.read(min(offset - self._position, self._buffer_size)):
+                break
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._terminate()
+        super().close()
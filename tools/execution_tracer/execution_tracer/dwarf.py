@@ -7,11 +7,19 @@
 from __future__ import annotations
 
 import fnmatch
+import hashlib
+import json
 import os
+import struct
+import sys
 import typing
-from typing import IO, TYPE_CHECKING, BinaryIO, Generator, Iterable, NamedTuple
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, BinaryIO, Generator, Iterable, Iterator, NamedTuple, Optional
 from elftools.common.utils import bytes2str
 from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import NoteSection
 from execution_tracer.common_utils import PathSubstitution, apply_path_substitutions
 
 if TYPE_CHECKING:
@@ -19,6 +27,12 @@ if TYPE_CHECKING:
     from elftools.dwarf.compileunit import CompileUnit
     from elftools.dwarf.lineprogram import LineProgramEntry
 
+LINE_TABLE_SIGNATURE = b"ReTraceLines"
+LINE_TABLE_VERSION = 1
+LINE_TABLE_EXTENSION = ".lines"
+# Number of rows, length of the JSON list of files
+LINE_TABLE_HEADER = struct.Struct("<QQ")
+
 
 def get_dwarf_info(elf_file_handler: BinaryIO) -> 'DWARFInfo':
     elf_file = ELFFile(elf_file_handler)
@@ -28,12 +42,12 @@ def get_dwarf_info(elf_file_handler: BinaryIO) -> 'DWARFInfo':
         )
     return elf_file.get_dwarf_info()
 
-def find_code_files(dwarf_info: 'DWARFInfo', substitute_paths: Iterable[PathSubstitution], ignore_paths: Iterable[str], verbose=True) -> list[IO]:
+def find_code_files(line_table: Iterable[DWARFLineProgramEntry], substitute_paths: Iterable[PathSubstitution], ignore_paths: Iterable[str], verbose=True) -> list[IO]:
     unique_files: set[str] = set()
     code_files: list[IO] = []
     if verbose:
         print('Attempting to resolve source files by scanning DWARF data...')
-    for entry in get_addresses(dwarf_info):
+    for entry in line_table:
         absolute_path = os.path.join(entry.file_path, entry.file_name)
         if any(fnmatch.fnmatch(absolute_path, pat) for pat in ignore_paths):
             continue
@@ -97,3 +111,172 @@ def get_addresses_for_CU(dwarf_info: DWARFInfo, CU: CompileUnit, *, debug=False,
             previous_state = None
         else:
             previous_state = entry.state
+
+
+@dataclass
+class LineTable:
+    """
+    Rows of line programs of all compile units, extracted once to be cached and reused.
+
+    Each file is stored once, rows refer to it with its index in `files`.
+    """
+    # Pairs of the directory and the file name
+    files: list[tuple[str, str]] = field(default_factory=list)
+    file_id: array = field(default_factory=lambda: array("L"))
+    line_number: array = field(default_factory=lambda: array("L"))
+    address_low: array = field(default_factory=lambda: array("Q"))
+    address_high: array = field(default_factory=lambda: array("Q"))
+
+    def _columns(self) -> tuple[array, ...]:
+        return (self.file_id, self.line_number, self.address_low, self.address_high)
+
+    def __len__(self) -> int:
+        return len(self.file_id)
+
+    def __iter__(self) -> Iterator[DWARFLineProgramEntry]:
+        files = self.files
+        for file_id, line_number, address_low, address_high in zip(*self._columns()):
+            file_path, file_name = files[file_id]
+            yield DWARFLineProgramEntry(file_name, file_path, line_number, address_low, address_high)
+
+    def extend(self, entries: Iterable[DWARFLineProgramEntry]) -> None:
+        file_ids = {file: i for i, file in enumerate(self.files)}
+        for entry in entries:
+            file = (entry.file_path, entry.file_name)
+            file_id = file_ids.get(file)
+            if file_id is None:
+                file_id = file_ids[file] = len(self.files)
+                self.files.append(file)
+            self.file_id.append(file_id)
+            self.line_number.append(entry.line_number)
+            self.address_low.append(entry.address_low)
+            self.address_high.append(entry.address_high)
+
+    def save(self, file: BinaryIO) -> None:
+        files = json.dumps(self.files).encode()
+        file.write(LINE_TABLE_SIGNATURE)
+        file.write(bytes([LINE_TABLE_VERSION]))
+        file.write(LINE_TABLE_HEADER.pack(len(self), len(files)))
+        file.write(files)
+        for column in self._columns():
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            column.tofile(file)
+
+    @classmethod
+    def load(cls, file: BinaryIO) -> LineTable:
+        if file.read(len(LINE_TABLE_SIGNATURE)) != LINE_TABLE_SIGNATURE:
+            raise ValueError("Line table signature isn't detected")
+        version = file.read(1)
+        if version != bytes([LINE_TABLE_VERSION]):
+            raise ValueError(f"Unsupported line table version {version}, expected {LINE_TABLE_VERSION}")
+        header = file.read(LINE_TABLE_HEADER.size)
+        if len(header) != LINE_TABLE_HEADER.size:
+            raise ValueError("Invalid line table header")
+        row_count, files_length = LINE_TABLE_HEADER.unpack(header)
+
+        line_table = cls([tuple(file) for file in json.loads(file.read(files_length))])
+        try:
+            for column in line_table._columns():
+                column.fromfile(file, row_count)
+        except EOFError:
+            raise ValueError("Unexpected end of line table file")
+        if sys.byteorder != "little":
+            for column in line_table._columns():
+                column.byteswap()
+        return line_table
+
+
+def get_default_cache_directory() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "renode-retracer", "line-tables")
+
+
+def get_elf_key(elf_file_handler: BinaryIO) -> str:
+    # The GNU build ID identifies the binary if it has one, otherwise the hash of its contents is used
+    elf_file = ELFFile(elf_file_handler)
+    for section in elf_file.iter_sections():
+        if not isinstance(section, NoteSection):
+            continue
+        for note in section.iter_notes():
+            if note["n_type"] == "NT_GNU_BUILD_ID":
+                return f"build-id-{note['n_desc']}"
+
+    position = elf_file_handler.tell()
+    elf_file_handler.seek(0)
+    digest = hashlib.sha256()
+    while block := elf_file_handler.read(1024 * 1024):
+        digest.update(block)
+    elf_file_handler.seek(position)
+    return f"sha256-{digest.hexdigest()}"
+
+
+def _extract_compile_units(elf_path: str, offsets: list[int]) -> list[LineTable]:
+    # Runs in worker processes, each one parses DWARF data of the binary on its own
+    with open(elf_path, "rb") as elf_file_handler:
+        dwarf_info = get_dwarf_info(elf_file_handler)
+        line_tables = []
+        for offset in offsets:
+            line_table = LineTable()
+            line_table.extend(get_addresses_for_CU(dwarf_info, dwarf_info.get_CU_at(offset)))
+            line_tables.append(line_table)
+    return line_tables
+
+
+def extract_line_table(elf_file_handler: BinaryIO, *, jobs: int = 1, debug=False, noisy=False) -> LineTable:
+    dwarf_info = get_dwarf_info(elf_file_handler)
+    line_table = LineTable()
+    elf_path = getattr(elf_file_handler, "name", None)
+    if jobs <= 1 or not isinstance(elf_path, str) or not os.path.isfile(elf_path):
+        line_table.extend(get_addresses(dwarf_info, debug=debug, noisy=noisy))
+        return line_table
+
+    # Compile units are distributed between jobs by their size, the biggest ones first
+    compile_units = [(CU.cu_offset, CU["unit_length"]) for CU in dwarf_info.iter_CUs()]
+    job_offsets: list[list[int]] = [[] for _ in range(min(jobs, len(compile_units)))]
+    job_sizes = [0] * len(job_offsets)
+    for offset, size in sorted(compile_units, key=lambda compile_unit: -compile_unit[1]):
+        job = job_sizes.index(min(job_sizes))
+        job_offsets[job].append(offset)
+        job_sizes[job] += size
+
+    line_table_per_offset: dict[int, LineTable] = {}
+    with ProcessPoolExecutor(max_workers=len(job_offsets)) as executor:
+        for offsets, line_tables in zip(job_offsets, executor.map(_extract_compile_units, [elf_path] * len(job_offsets), job_offsets)):
+            line_table_per_offset.update(zip(offsets, line_tables))
+    # Rows are merged in the order of compile units, the same as when extracted in a single process
+    for offset, _ in compile_units:
+        line_table.extend(line_table_per_offset[offset])
+    return line_table
+
+
+def get_line_table(elf_file_handler: BinaryIO, *, jobs: int = 1, cache_directory: Optional[str] = None, debug=False, noisy=False) -> LineTable:
+    # Line tables are cached in `cache_directory`, if it's given, so that DWARF data of a binary is parsed only once
+    if cache_directory is None:
+        return extract_line_table(elf_file_handler, jobs=jobs, debug=debug, noisy=noisy)
+
+    cache_path = os.path.join(cache_directory, get_elf_key(elf_file_handler) + LINE_TABLE_EXTENSION)
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "rb") as file:
+                line_table = LineTable.load(file)
+            if debug:
+                print(f'Using line table cached in {cache_path}')
+            return line_table
+        except (ValueError, OSError) as e:
+            print(f'Ignoring invalid line table cache {cache_path}: {e}', file=sys.stderr)
+
+    line_table = extract_line_table(elf_file_handler, jobs=jobs, debug=debug, noisy=noisy)
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        # The cache is written to a temporary file first, so that other runs never see it partially written
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            line_table.save(file)
+        os.replace(temporary_path, cache_path)
+    except OSError as e:
+        # The cache only speeds up next runs, so e.g. a directory that isn't writable isn't an error
+        if debug:
+            print(f'Line table of {elf_file_handler.name} couldn\'t be cached in {cache_directory}: {e}')
+    return line_table
@@ -9,33 +9,85 @@ from __future__ import annotations
 
 import argparse
 import contextlib
+import functools
 import itertools
 import platform
+import shutil
+import sqlite3
 import sys
 import os
-import gzip
+import io
+import math
+import mmap
+import random
+import struct
+import tempfile
+import time
 import urllib.request
 import urllib.error
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from dataclasses import dataclass
-from typing import IO, BinaryIO, NamedTuple, Optional
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, BinaryIO, Callable, Generator, Iterable, Iterator, NamedTuple, NoReturn, Optional, TypeVar, Union
 
-from ctypes import cdll, c_char_p, POINTER, c_void_p, c_ubyte, c_uint64, c_byte, c_size_t, cast
+from ctypes import cdll, c_char_p, POINTER, c_void_p, c_ubyte, c_uint64, c_size_t, cast, create_string_buffer
 
 # Allow directly using this as a script, without installation
 try:
     import execution_tracer.coverage as coverage
+    import execution_tracer.coverage_database as coverage_database
+    import execution_tracer.dwarf as dwarf
     import execution_tracer.coverview_integration as coverview_integration
+    import execution_tracer.trace_index as trace_index
+    from execution_tracer.common_utils import parse_address_range, parse_entry_window, parse_opcode_mask
+    from execution_tracer.decompression import Compression, PipelinedDecompressor, COMPRESSION_EXTENSIONS, detect_compression, open_compressed_output
+    import execution_tracer.export as export
+    import execution_tracer.trace_stats as trace_stats
+    import execution_tracer.trace_diff as trace_diff
+    import execution_tracer.trace_profile as trace_profile
 except ImportError:
     import coverage
+    import coverage_database
+    import dwarf
     import coverview_integration
+    import trace_index
+    from common_utils import parse_address_range, parse_entry_window, parse_opcode_mask
+    from decompression import Compression, PipelinedDecompressor, COMPRESSION_EXTENSIONS, detect_compression, open_compressed_output
+    import export
+    import trace_stats
+    import trace_diff
+    import trace_profile
+
+if TYPE_CHECKING:
+    from execution_tracer.trace_index import TraceIndex
 
 FILE_SIGNATURE = b"ReTrace"
 FILE_VERSION = b"\x05"
 HEADER_LENGTH = 10
 MEMORY_ACCESS_LENGTH = 25
 RISCV_VECTOR_CONFIGURATION_LENGTH = 16
+RISCV_ATOMIC_INSTRUCTION_HEADER_LENGTH = 3
+BLOCK_HEADER_LENGTH = 9
 BYTE_ORDER = "little"
+# Formats of PCs, which can be unpacked with `struct`
+PC_STRUCT_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+# Number of bytes read from the trace file at once
+READ_BUFFER_SIZE = 1024 * 1024
+# Default number of entries in chunks returned by `TraceData.iter_chunks`
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Entries between samples further apart are skipped instead of being decoded
+SAMPLE_SKIP_DISTANCE = 64
+# Number of entries checked for a run of entries of the same shape, before checking further ones
+FIXED_SHAPE_PROBE_LENGTH = 16
+# Time between checks if a followed trace has grown, in seconds
+FOLLOW_POLL_INTERVAL = 0.5
+# Amount of formatted text collected before it's written out
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+# Number of disassembled instructions remembered by each disassembler
+DISASSEMBLY_CACHE_SIZE = 4096
+DISASSEMBLY_BUFFER_SIZE = 1024
 
 
 class AdditionalDataType(Enum):
@@ -128,9 +180,20 @@ def read_header(file: BinaryIO) -> Header:
         raise InvalidFileFormatException("Invalid opcodes field at file header")
 
 
-def read_file(file: BinaryIO, disassemble: bool, llvm_disas_path: Optional[str]) -> TraceData:
+class TraceFile(NamedTuple):
+    path: str
+    compression: Compression
+    use_mmap: bool = False
+
+    def open(self) -> BinaryIO:
+        if self.compression != Compression.NONE:
+            return PipelinedDecompressor(self.path, self.compression)
+        return open(self.path, "rb")
+
+
+def read_file(file: BinaryIO, disassemble: bool, llvm_disas_path: Optional[str], use_mmap: bool = False) -> TraceData:
     header = read_header(file)
-    return TraceData(file, header, disassemble, llvm_disas_path)
+    return TraceData(file, header, disassemble, llvm_disas_path, use_mmap)
 
 
 def bytes_to_hex(bytes: bytes, zero_padded=True) -> str:
@@ -146,18 +209,195 @@ def bytes_to_thumb_hex(bytes: bytes) -> str:
     low = int.from_bytes(bytes[2:4], byteorder="little", signed=False)
     return f"0x{high:04X}{low:04X}"
 
+def get_atomic_word_size(width_raw: int) -> int:
+    width = RiscVAtomicInstructionWidth(width_raw)
+    if width == RiscVAtomicInstructionWidth.QuadWord:
+        raise InvalidFileFormatException("Support for QuadWord atomic operands not yet implemented")
+    return 4 if width == RiscVAtomicInstructionWidth.Word else 8
+
+# Additional data records keep raw values, they are turned into text only by `TraceData.format_entry`
+class MemoryAccess(NamedTuple):
+    type: MemoryAccessType
+    address: int
+    value: int
+    address_physical: int
+
+class RiscVVectorConfiguration(NamedTuple):
+    vl: int
+    vtype: int
+
+class RiscVAtomicOperands(NamedTuple):
+    is_after_execution: bool
+    rd: int
+    rs1: int
+    rs2: int
+    memory_value: int
+
+class Registers(NamedTuple):
+    pre_opcode: bool
+    # Pairs of register names and values
+    values: list[tuple[str, int]]
+
+AdditionalData = Union[MemoryAccess, RiscVVectorConfiguration, RiscVAtomicOperands, Registers]
+
+class RegistersLayout:
+    """
+    Names and widths of registers in a registers data record.
+
+    The same registers are usually traced for every instruction, so records are matched against known layouts
+    and unpacked with precompiled structs, instead of reading and decoding register names one by one.
+    """
+    def __init__(self, data: bytes):
+        # `data` has to be a valid registers data record
+        static_format = "<x"
+        values_format = "<B"
+        self._name_ranges: list[tuple[int, int]] = []
+        # Indices of values, which are unpacked as bytes as they don't have a struct format
+        self._wide_values: list[int] = []
+        self._names: Optional[tuple[str, ...]] = None
+        # Names and widths are kept as raw segments between values, the first one includes the number of registers too
+        static_start = 1
+        position = 2
+        for i in range(data[1]):
+            name_size = data[position]
+            self._name_ranges.append((position + 1, position + 1 + name_size))
+            position += 1 + name_size
+            width = data[position]
+            position += 1
+            value_format = PC_STRUCT_FORMATS.get(width)
+            if value_format is None:
+                value_format = f"{width}s"
+                self._wide_values.append(i)
+            static_format += f"{position - static_start}s{width}x"
+            values_format += f"{position - static_start}x{value_format}"
+            position += width
+            static_start = position
+        self._static_struct = struct.Struct(static_format)
+        self._values_struct = struct.Struct(values_format)
+        self._static = self._static_struct.unpack_from(data)
+        self._data = bytes(data)
+        self.size = position
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        # Names are decoded only once records are parsed, just scanning past them doesn't require it
+        if self._names is None:
+            try:
+                self._names = tuple(str(self._data[start:end], "utf-8") for start, end in self._name_ranges)
+            except UnicodeError:
+                raise InvalidFileFormatException("Invalid registers data, can't decode register name")
+        return self._names
+
+    def matches(self, buffer: bytes, position: int) -> bool:
+        return position + self.size <= len(buffer) and self._static_struct.unpack_from(buffer, position) == self._static
+
+    def unpack(self, data: bytes) -> Registers:
+        pre_opcode, *values = self._values_struct.unpack_from(data)
+        for i in self._wide_values:
+            values[i] = int.from_bytes(values[i], byteorder=BYTE_ORDER)
+        return Registers(bool(pre_opcode), list(zip(self.names, values)))
+
 class TraceEntry(NamedTuple):
     pc: bytes
     opcode: bytes
-    additional_data: list[str]
+    additional_data: list[AdditionalData]
     isa_mode: int
 
+@dataclass
+class TraceChunk:
+    """
+    Columnar view of consecutive trace entries.
+
+    Opcodes and additional data aren't copied out of the raw trace data, the chunk only stores offsets into `data`.
+    Additional data of an entry is a sequence of records ended with the `AdditionalDataType.Empty` marker.
+    """
+    data: bytes
+    # Offset of `data` in the (uncompressed) trace file
+    data_offset: int
+    start_index: int
+    offset: array = field(default_factory=lambda: array("Q"))
+    pc: array = field(default_factory=lambda: array("Q"))
+    opcode_length: array = field(default_factory=lambda: array("B"))
+    opcode_offset: array = field(default_factory=lambda: array("Q"))
+    isa_mode: array = field(default_factory=lambda: array("B"))
+    additional_data_offset: array = field(default_factory=lambda: array("Q"))
+    # Entries starting multi-ISA blocks, as indices in the chunk, and lengths of these blocks
+    block_start: array = field(default_factory=lambda: array("Q"))
+    block_length: array = field(default_factory=lambda: array("Q"))
+
+    def __len__(self) -> int:
+        return len(self.pc)
+
+    def get_opcode(self, index: int) -> bytes:
+        offset = self.opcode_offset[index]
+        return self.data[offset:offset + self.opcode_length[index]]
+
+    def get_file_offset(self, index: int) -> int:
+        return self.data_offset + self.offset[index]
+
+    def select(self, indices: list[int]) -> TraceChunk:
+        # Chunk of only the given entries, e.g. sampled ones, its `start_index` is the number of the first of them
+        chunk = TraceChunk(self.data, self.data_offset, self.start_index + indices[0] if indices else self.start_index)
+        for column in ("offset", "pc", "opcode_length", "opcode_offset", "isa_mode", "additional_data_offset"):
+            values = getattr(self, column)
+            getattr(chunk, column).extend(values[i] for i in indices)
+        block_lengths = dict(zip(self.block_start, self.block_length))
+        for j, i in enumerate(indices):
+            if i in block_lengths:
+                chunk.block_start.append(j)
+                chunk.block_length.append(block_lengths[i])
+        return chunk
+
+@dataclass
+class EntryFilter:
+    # Ranges are in the (start, end) format, with the end excluded
+    pc_range: Optional[tuple[int, int]] = None
+    # Entries have to contain a memory access matching both the address range and one of the access types
+    address_range: Optional[tuple[int, int]] = None
+    access_types: Optional[set[MemoryAccessType]] = None
+    # Opcode, as a little-endian number, and a mask of its bits that are compared
+    opcode_mask: Optional[tuple[int, int]] = None
+    # Triples or triples and models, as in the trace header
+    isas: Optional[list[str]] = None
+
+    def filters_memory_accesses(self) -> bool:
+        return self.address_range is not None or self.access_types is not None
+
+@dataclass
+class EntrySampling:
+    # Every `every`-th entry is picked or, with the `probability`, each entry is picked with it
+    every: int = 1
+    probability: Optional[float] = None
+    seed: Optional[int] = None
+
+    def iter_indices(self, start: int = 0, count: Optional[int] = None) -> Iterator[int]:
+        end = None if count is None else start + count
+        if self.probability is not None:
+            return self._iter_random_indices(start, end)
+        if end is None:
+            return itertools.count(start, self.every)
+        return iter(range(start, end, self.every))
+
+    def _iter_random_indices(self, start: int, end: Optional[int]) -> Iterator[int]:
+        # Gaps between randomly picked entries follow the geometric distribution, so they're drawn directly instead of drawing for each entry
+        rnd = random.Random(self.seed)
+        log_miss_probability = math.log(1 - self.probability) if self.probability < 1 else None
+        index = start - 1
+        while True:
+            index += 1
+            if log_miss_probability is not None:
+                index += int(math.log(1 - rnd.random()) / log_miss_probability)
+            if end is not None and index >= end:
+                return
+            yield index
+
 class TraceData:
     disassemblers: dict[str, LLVMDisassembler] = {}
     instructions_left_in_block = 0
     active_triple_and_model: str = None
+    active_isa_mode: int = 0
 
-    def __init__(self, file: IO, header: Header, disassemble: bool, llvm_disas_path: Optional[str]):
+    def __init__(self, file: IO, header: Header, disassemble: bool, llvm_disas_path: Optional[str], use_mmap: bool = False):
         self.file = file
         self.pc_length = int(header.pc_length)
         self.has_pc = (self.pc_length != 0)
@@ -175,11 +415,44 @@ class TraceData:
                 raise RuntimeError("No architecture triple available in disassembly mode. Trace file might be corrupted")
             if not llvm_disas_path:
                 raise RuntimeError("No path to decompiler library provided")
+        # Runs of entries of the same shape, without additional data and with opcodes of the same length, are decoded
+        # at once with precompiled structs, instead of field by field. Blocks of multiple ISAs break such runs, so they aren't supported.
+        self._fixed_shape = not self.multiple_triple_and_models
+        self._fixed_shape_structs: dict[int, struct.Struct] = {}
+        if self._fixed_shape and not self.has_opcodes:
+            self._get_fixed_shape_struct(self.pc_length + 1)
+        # Layouts of registers data records by their length, and the layout of the last scanned record
+        self._registers_layouts: dict[int, RegistersLayout] = {}
+        self._registers_layout: Optional[RegistersLayout] = None
+        # Entries are decoded from a buffer filled with large reads, instead of reading the file field by field
+        self._buffer = b""
+        self._position = 0
+        self._buffer_offset = 0
+        self._end_of_file = False
+        self._entry_index = 0
+        self._new_block = False
+        # In the memory-mapped mode the whole file is the buffer, so entries' fields are `memoryview` slices into the mapping
+        self._mapping = None
+        if use_mmap:
+            if not isinstance(file, io.BufferedReader):
+                raise ValueError("Memory-mapping is supported only for uncompressed trace files")
+            self._mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # In the follow mode the trace is still being written, so decoding waits for more data instead of ending
+        self.follow = False
+        self.follow_timeout: Optional[float] = None
+
+    def enable_follow(self, timeout: Optional[float] = None) -> None:
+        # Without the timeout, the trace is followed until the process is interrupted
+        if self._mapping is not None or not isinstance(self.file, io.BufferedReader):
+            raise ValueError("Following is supported only for uncompressed trace files, which aren't memory-mapped")
+        self.follow = True
+        self.follow_timeout = timeout
 
     def update_triple_and_model(self, idx: int):
         if idx >= len(self.triple_and_models):
             raise RuntimeError(f"Invalid triple_and_model index {idx} (out of {len(self.triple_and_models)})")
         self.active_triple_and_model = self.triple_and_models[idx]
+        self.active_isa_mode = idx
 
     def get_disas(self, triple_and_model: str) -> LLVMDisassembler:
         if triple_and_model in self.disassemblers:
@@ -192,164 +465,502 @@ class TraceData:
         return disas
 
     def __iter__(self):
-        self.file.seek(HEADER_LENGTH + self.extra_length, 0)
+        if self._mapping is not None:
+            self._buffer = memoryview(self._mapping)
+            self._position = HEADER_LENGTH + self.extra_length
+            self._buffer_offset = 0
+        else:
+            self.file.seek(HEADER_LENGTH + self.extra_length, 0)
+            self._buffer = b""
+            self._position = 0
+            self._buffer_offset = HEADER_LENGTH + self.extra_length
+        self._end_of_file = False
+        self._entry_index = 0
+        self._new_block = False
+        self.instructions_left_in_block = 0
         return self
 
     def __next__(self) -> TraceEntry:
-        additional_data = []
-
-        if self.multiple_triple_and_models and self.instructions_left_in_block == 0:
-            isa_idx_raw = self.file.read(1)
-            if len(isa_idx_raw) != 1:
-                # No more data frames to read
-                raise StopIteration
-
-            self.update_triple_and_model(isa_idx_raw[0])
-            
-            block_length_raw = self.file.read(8)
-            if len(block_length_raw) != 8:
-                raise InvalidFileFormatException("Unexpected end of file")
-            
-            # The `instructions_left_in_block` counter is kept only for traces produced by cores that can switch between multiple modes.
-            self.instructions_left_in_block = int.from_bytes(block_length_raw, byteorder=BYTE_ORDER, signed=False)
-
-        if self.multiple_triple_and_models:
-            self.instructions_left_in_block -= 1
-
-        pc = self.file.read(self.pc_length)
-        opcode_length = self.file.read(int(self.has_opcodes))
-
-        if self.pc_length != len(pc):
-            # No more data frames to read
-            raise StopIteration
-        if self.has_opcodes and len(opcode_length) == 0:
-            if self.has_pc:
-                raise InvalidFileFormatException("Unexpected end of file")
+        start = self._next_entry_start()
+        return self._entry_at(self._buffer, start, self.active_triple_and_model)
+
+    def iter_chunks(self, size: int = DEFAULT_CHUNK_SIZE, start: int = 0, count: Optional[int] = None,
+                    sidecar_index: Optional[TraceIndex] = None) -> Generator[TraceChunk, None, None]:
+        """
+        Decode `count` entries (or all remaining ones) in chunks of at most `size` entries, starting from the entry number `start`.
+        The index is used to seek close to the first entry instead of decoding all entries before it.
+        """
+        self.seek_entry(start, sidecar_index)
+        while count is None or count > 0:
+            chunk = self._decode_chunk(size if count is None else min(size, count))
+            if len(chunk) == 0:
+                return
+            if count is not None:
+                count -= len(chunk)
+            yield chunk
+
+    def iter_sampled_chunks(self, indices: Iterable[int], sidecar_index: Optional[TraceIndex] = None) -> Generator[TraceChunk, None, None]:
+        """
+        Decode only entries with the given, increasing, numbers. Chunks contain only these entries.
+
+        Entries between samples, which are far apart, aren't decoded. The index is used to seek over them, or they're skipped
+        without decoding them.
+        """
+        indices = iter(indices)
+        index = next(indices, None)
+        if index is None:
+            return
+        self.seek_entry(index, sidecar_index)
+        while index is not None:
+            if index - self._entry_index >= SAMPLE_SKIP_DISTANCE:
+                self._skip_to_entry(index, sidecar_index)
+            # Samples close to each other are picked from whole decoded chunks
+            chunk = self._decode_chunk(1 if index - self._entry_index >= SAMPLE_SKIP_DISTANCE else DEFAULT_CHUNK_SIZE)
+            if len(chunk) == 0:
+                return
+            end = chunk.start_index + len(chunk)
+            selected = []
+            while index is not None and index < end:
+                if index >= chunk.start_index:
+                    selected.append(index - chunk.start_index)
+                index = next(indices, None)
+            if selected:
+                yield chunk.select(selected)
+
+    def seek_entry(self, index: int, sidecar_index: Optional[TraceIndex] = None) -> None:
+        iter(self)
+        self._skip_to_entry(index, sidecar_index)
+
+    def _skip_to_entry(self, index: int, sidecar_index: Optional[TraceIndex]) -> None:
+        # Moves forward to the entry number `index`, seeking to the closest checkpoint of the index if it's ahead
+        checkpoint = sidecar_index.find_checkpoint(index) if sidecar_index is not None else None
+        if checkpoint is not None and checkpoint.entry_index > self._entry_index:
+            if self._mapping is not None:
+                self._position = checkpoint.offset
             else:
+                self.file.seek(checkpoint.offset, 0)
+                self._buffer = b""
+                self._position = 0
+                self._buffer_offset = checkpoint.offset
+            self._entry_index = checkpoint.entry_index
+            if self.triple_and_models:
+                self.update_triple_and_model(checkpoint.isa_mode)
+            self.instructions_left_in_block = checkpoint.instructions_left_in_block
+            self._new_block = False
+        self._skip_entries(index - self._entry_index)
+
+    def _skip_entries(self, count: int) -> None:
+        # Moves past `count` entries only finding their ends, without decoding them; stops at the end of the trace
+        target = self._entry_index + count
+        multiple_triple_and_models = self.multiple_triple_and_models
+        while self._entry_index < target and self._buffer_next_entry():
+            buffer = self._buffer
+            position = self._position
+            skipped = 0
+            remaining = target - self._entry_index
+            while skipped < remaining:
+                if multiple_triple_and_models and self.instructions_left_in_block == 0:
+                    if position + BLOCK_HEADER_LENGTH > len(buffer):
+                        break
+                    position = self._read_block_header(buffer, position)
+                    continue
+                if self._fixed_shape:
+                    # A few entries are checked first, so that probing traces with mostly variable entries stays cheap
+                    entry_length, run = self._get_fixed_shape_run(buffer, position, min(remaining - skipped, FIXED_SHAPE_PROBE_LENGTH))
+                    if run == FIXED_SHAPE_PROBE_LENGTH:
+                        entry_length, run = self._get_fixed_shape_run(buffer, position, min(remaining - skipped, DEFAULT_CHUNK_SIZE))
+                    if run > 0:
+                        position += run * entry_length
+                        skipped += run
+                        continue
+                end = self._scan_entry(buffer, position, self._end_of_file)
+                if end < 0:
+                    break
+                position = end
+                skipped += 1
+                if multiple_triple_and_models:
+                    self.instructions_left_in_block -= 1
+                    self._new_block = False
+            self._position = position
+            self._entry_index += skipped
+
+    def get_chunk_data(self, chunk: TraceChunk, start: int, end: int) -> memoryview:
+        # Raw data of entries from `start` to `end` (excluded), including block headers between them
+        return memoryview(chunk.data)[chunk.offset[start]:self._scan_entry(chunk.data, chunk.offset[end - 1], True)]
+
+    def get_chunk_entry(self, chunk: TraceChunk, index: int) -> TraceEntry:
+        triple_and_model = self.triple_and_models[chunk.isa_mode[index]] if self.triple_and_models else None
+        return self._entry_at(chunk.data, chunk.offset[index], triple_and_model)
+
+    def _decode_chunk(self, size: int) -> TraceChunk:
+        chunk = TraceChunk(self._buffer, self._buffer_offset, self._entry_index)
+        pc_length = self.pc_length
+        has_opcodes = self.has_opcodes
+        multiple_triple_and_models = self.multiple_triple_and_models
+        append_offset = chunk.offset.append
+        append_pc = chunk.pc.append
+        append_opcode_length = chunk.opcode_length.append
+        append_opcode_offset = chunk.opcode_offset.append
+        append_isa_mode = chunk.isa_mode.append
+        append_additional_data_offset = chunk.additional_data_offset.append
+
+        count = 0
+        while count < size:
+            buffer = self._buffer
+            length = len(buffer)
+            position = self._position
+            if self._fixed_shape:
+                position, decoded = self._decode_fixed_shape_entries(chunk, buffer, position, size - count)
+                count += decoded
+            while count < size:
+                if multiple_triple_and_models and self.instructions_left_in_block == 0:
+                    if position + BLOCK_HEADER_LENGTH > length:
+                        break
+                    position = self._read_block_header(buffer, position)
+                    continue
+                opcode_offset = position + pc_length + has_opcodes
+                if has_opcodes:
+                    if opcode_offset > length:
+                        break
+                    opcode_length = buffer[opcode_offset - 1]
+                else:
+                    opcode_length = 0
+                additional_data_offset = opcode_offset + opcode_length
+                if additional_data_offset < length and buffer[additional_data_offset] == AdditionalDataType.Empty.value:
+                    end = additional_data_offset + 1
+                else:
+                    end = self._scan_entry(buffer, position, self._end_of_file)
+                    if end < 0:
+                        break
+                if multiple_triple_and_models:
+                    if self._new_block:
+                        chunk.block_start.append(count)
+                        chunk.block_length.append(self.instructions_left_in_block)
+                        self._new_block = False
+                    self.instructions_left_in_block -= 1
+                append_offset(position)
+                append_pc(int.from_bytes(buffer[position:position + pc_length], byteorder=BYTE_ORDER, signed=False))
+                append_opcode_length(opcode_length)
+                append_opcode_offset(opcode_offset)
+                append_isa_mode(self.active_isa_mode)
+                append_additional_data_offset(additional_data_offset)
+                position = end
+                count += 1
+            self._position = position
+            self._entry_index = chunk.start_index + count
+
+            # Entries of a single chunk have to come from the same buffer, so refill it only before the first one
+            if count > 0 or not self._buffer_next_entry():
+                break
+        chunk.data = self._buffer
+        chunk.data_offset = self._buffer_offset
+        return chunk
+
+    def _get_fixed_shape_struct(self, entry_length: int) -> Optional[struct.Struct]:
+        if entry_length not in self._fixed_shape_structs:
+            pc_format = PC_STRUCT_FORMATS.get(self.pc_length)
+            # Only PCs are unpacked, the rest of the entry is skipped
+            self._fixed_shape_structs[entry_length] = None if pc_format is None else struct.Struct(f"<{pc_format}{entry_length - self.pc_length}x")
+        return self._fixed_shape_structs[entry_length]
+
+    def _get_fixed_shape_run(self, buffer: bytes, position: int, size: int) -> tuple[int, int]:
+        # Returns the length and the number (up to `size`) of consecutive entries of the same shape as the one at `position`
+        pc_length = self.pc_length
+        opcode_length = 0
+        if self.has_opcodes:
+            if position + pc_length >= len(buffer):
+                return 0, 0
+            opcode_length = buffer[position + pc_length]
+        additional_data_offset = pc_length + self.has_opcodes + opcode_length
+        entry_length = additional_data_offset + 1
+        count = min(size, (len(buffer) - position) // entry_length)
+        if count == 0:
+            return entry_length, 0
+        end = position + count * entry_length
+
+        # The run ends at the first entry with additional data or with an opcode of a different length
+        terminators = bytes(buffer[position + additional_data_offset:end:entry_length])
+        count = len(terminators) - len(terminators.lstrip(b"\x00"))
+        if self.has_opcodes:
+            opcode_lengths = bytes(buffer[position + pc_length:position + count * entry_length:entry_length])
+            count = len(opcode_lengths) - len(opcode_lengths.lstrip(bytes((opcode_length,))))
+        return entry_length, count
+
+    def _decode_fixed_shape_entries(self, chunk: TraceChunk, buffer: bytes, position: int, size: int) -> tuple[int, int]:
+        # Decodes up to `size` entries of the same shape as the one at `position`. Returns the position after them and their number.
+        entry_length, count = self._get_fixed_shape_run(buffer, position, size)
+        if count == 0:
+            return position, 0
+        end = position + count * entry_length
+        pc_length = self.pc_length
+        opcode_length = entry_length - 1 - pc_length - self.has_opcodes
+        additional_data_offset = entry_length - 1
+
+        entry_struct = self._get_fixed_shape_struct(entry_length)
+        if entry_struct is not None:
+            chunk.pc.extend(itertools.chain.from_iterable(entry_struct.iter_unpack(buffer[position:end])))
+        else:
+            chunk.pc.extend(int.from_bytes(buffer[i:i + pc_length], byteorder=BYTE_ORDER) for i in range(position, end, entry_length))
+        chunk.offset.extend(range(position, end, entry_length))
+        chunk.opcode_length.extend(itertools.repeat(opcode_length, count))
+        chunk.opcode_offset.extend(range(position + pc_length + self.has_opcodes, end, entry_length))
+        chunk.isa_mode.extend(itertools.repeat(self.active_isa_mode, count))
+        chunk.additional_data_offset.extend(range(position + additional_data_offset, end, entry_length))
+        return end, count
+
+    def _fill_buffer(self) -> bool:
+        if self._mapping is not None:
+            return False
+        data = self.file.read(READ_BUFFER_SIZE)
+        # After the follow timeout passed once, the trace isn't waited for again
+        if not data and self.follow and not self._end_of_file:
+            data = self._wait_for_data()
+        if not data:
+            return False
+        # The end of the file moved, so the last entry buffered so far might not be complete
+        self._end_of_file = False
+        self._buffer_offset += self._position
+        self._buffer = self._buffer[self._position:] + data
+        self._position = 0
+        return True
+
+    def _wait_for_data(self) -> bytes:
+        # Returns no data if the trace didn't grow within the follow timeout
+        start = time.monotonic()
+        while self.follow_timeout is None or time.monotonic() - start < self.follow_timeout:
+            time.sleep(FOLLOW_POLL_INTERVAL)
+            data = self.file.read(READ_BUFFER_SIZE)
+            if data:
+                return data
+        return b""
+
+    def _buffer_next_entry(self) -> bool:
+        # Makes sure the next entry (or block header) is fully buffered. Returns False if there are no more entries.
+        while True:
+            buffer = self._buffer
+            position = self._position
+            if self.multiple_triple_and_models and self.instructions_left_in_block == 0:
+                if position + BLOCK_HEADER_LENGTH <= len(buffer):
+                    return True
+            elif self._scan_entry(buffer, position, self._end_of_file) >= 0:
+                return True
+
+            if self._fill_buffer():
+                continue
+            if not self._end_of_file:
+                # Traces can end without the terminator of the last entry's additional data
+                self._end_of_file = True
+                continue
+            remaining = len(buffer) - position
+            if remaining == 0 or remaining < self.pc_length:
                 # No more data frames to read
-                raise StopIteration
+                return False
+            if self.follow:
+                # The trace stopped growing while the tracer was writing an entry, what was decoded so far is still valid
+                print(f"Ignoring an incomplete entry at the end of the followed trace {self.file.name}", file=sys.stderr)
+                return False
+            raise InvalidFileFormatException("Unexpected end of file")
 
+    def _read_block_header(self, buffer: bytes, position: int) -> int:
+        block_end = position + BLOCK_HEADER_LENGTH
+        self.update_triple_and_model(buffer[position])
+        # The `instructions_left_in_block` counter is kept only for traces produced by cores that can switch between multiple modes.
+        self.instructions_left_in_block = int.from_bytes(buffer[position + 1:block_end], byteorder=BYTE_ORDER, signed=False)
+        self._new_block = True
+        return block_end
+
+    def _next_entry_start(self) -> int:
+        # Returns the position of the next entry in the buffer and moves past it
+        while True:
+            if not self._buffer_next_entry():
+                raise StopIteration
+            position = self._position
+            if self.multiple_triple_and_models and self.instructions_left_in_block == 0:
+                self._position = self._read_block_header(self._buffer, position)
+                continue
+            self._position = self._scan_entry(self._buffer, position, self._end_of_file)
+            self._entry_index += 1
+            if self.multiple_triple_and_models:
+                self.instructions_left_in_block -= 1
+            return position
+
+    def _scan_entry(self, buffer: bytes, position: int, final: bool) -> int:
+        # Returns the position right after the entry or -1 if it isn't complete
+        position += self.pc_length
         if self.has_opcodes:
-            opcode_length = opcode_length[0]
-            opcode = self.file.read(opcode_length)
-            if len(opcode) != opcode_length:
-                raise InvalidFileFormatException("Unexpected end of file")
+            if position >= len(buffer):
+                return -1
+            position += 1 + buffer[position]
+        while True:
+            if position >= len(buffer):
+                return len(buffer) if final and position == len(buffer) else -1
+            additional_data_type = AdditionalDataType(buffer[position])
+            position += 1
+            if additional_data_type is AdditionalDataType.Empty:
+                return position
+            length = self._additional_data_length(additional_data_type, buffer, position)
+            if length < 0:
+                return -1
+            position += length
+
+    def _additional_data_length(self, additional_data_type: AdditionalDataType, buffer: bytes, position: int) -> int:
+        # Returns the length of the additional data record starting at `position` or -1 if it isn't complete
+        if additional_data_type is AdditionalDataType.MemoryAccess:
+            return MEMORY_ACCESS_LENGTH
+        elif additional_data_type is AdditionalDataType.RiscVVectorConfiguration:
+            return RISCV_VECTOR_CONFIGURATION_LENGTH
+        elif additional_data_type is AdditionalDataType.RiscVAtomicInstruction:
+            if position + RISCV_ATOMIC_INSTRUCTION_HEADER_LENGTH > len(buffer):
+                return -1
+            return RISCV_ATOMIC_INSTRUCTION_HEADER_LENGTH + 4 * get_atomic_word_size(buffer[position + 1])
+        elif additional_data_type is AdditionalDataType.Registers:
+            return self._registers_data_length(buffer, position)
+        raise InvalidFileFormatException(f"Unexpected additional data type {additional_data_type}")
+
+    def _registers_data_length(self, buffer: bytes, position: int) -> int:
+        layout = self._registers_layout
+        if layout is not None and layout.matches(buffer, position):
+            return layout.size
+        length = self._scan_registers_data(buffer, position)
+        # The value of the last register can still be incomplete
+        if 0 < length <= len(buffer) - position:
+            self._registers_layout = self._get_registers_layout(buffer[position:position + length])
+        return length
+
+    def _get_registers_layout(self, data: bytes) -> RegistersLayout:
+        # Falls back to creating a new layout only if the registers differ from the known layout of records of that length
+        layout = self._registers_layouts.get(len(data))
+        if layout is None or not layout.matches(data, 0):
+            layout = RegistersLayout(data)
+            self._registers_layouts[len(data)] = layout
+        return layout
+
+    def _scan_registers_data(self, buffer: bytes, position: int) -> int:
+        start = position
+        if position + 2 > len(buffer):
+            return -1
+        registers_count = buffer[position + 1]
+        if registers_count == 0:
+            raise InvalidFileFormatException("Invalid registers data, can't read registers number")
+        position += 2
+        for _ in range(registers_count):
+            if position >= len(buffer):
+                return -1
+            register_name_size = buffer[position]
+            if register_name_size == 0:
+                raise InvalidFileFormatException("Invalid registers data, register name size is 0")
+            position += 1 + register_name_size
+            if position >= len(buffer):
+                return -1
+            width = buffer[position]
+            if width == 0:
+                raise InvalidFileFormatException("Invalid registers data, register size is 0")
+            position += 1 + width
+        return position - start
+
+    def _entry_at(self, buffer: bytes, position: int, triple_and_model: Optional[str]) -> TraceEntry:
+        pc = buffer[position:position + self.pc_length]
+        position += self.pc_length
+        if self.has_opcodes:
+            opcode_length = buffer[position]
+            opcode = buffer[position + 1:position + 1 + opcode_length]
+            position += 1 + opcode_length
         else:
             opcode = b""
 
-        additional_data_type = AdditionalDataType(self.file.read(1)[0])
-        while (additional_data_type is not AdditionalDataType.Empty):
+        additional_data = []
+        while position < len(buffer) and buffer[position] != AdditionalDataType.Empty.value:
+            additional_data_type = AdditionalDataType(buffer[position])
+            position += 1
+            end = position + self._additional_data_length(additional_data_type, buffer, position)
+            data = buffer[position:end]
             if additional_data_type is AdditionalDataType.MemoryAccess:
-                additional_data.append(self.parse_memory_access_data())
+                additional_data.append(self.parse_memory_access_data(data))
             elif additional_data_type is AdditionalDataType.RiscVVectorConfiguration:
-                additional_data.append(self.parse_riscv_vector_configuration_data())
+                additional_data.append(self.parse_riscv_vector_configuration_data(data))
             elif additional_data_type is AdditionalDataType.RiscVAtomicInstruction:
-                additional_data.append(self.parse_riscv_atomic_instruction_data())
+                additional_data.append(self.parse_riscv_atomic_instruction_data(data))
             elif additional_data_type is AdditionalDataType.Registers:
-                additional_data.append(self.parse_registers_data())
-
-            try:
-                additional_data_type = AdditionalDataType(self.file.read(1)[0])
-            except IndexError:
-                break
-        return TraceEntry(pc, opcode, additional_data, self.active_triple_and_model)
+                additional_data.append(self.parse_registers_data(data))
+            position = end
+        return TraceEntry(pc, opcode, additional_data, triple_and_model)
 
-    def parse_memory_access_data(self) -> str:
-        data = self.file.read(MEMORY_ACCESS_LENGTH)
+    def parse_memory_access_data(self, data: bytes) -> MemoryAccess:
         if len(data) != MEMORY_ACCESS_LENGTH:
             raise InvalidFileFormatException("Unexpected end of file")
-        type = MemoryAccessType(data[0])
-        address = bytes_to_hex(data[1:9], zero_padded=False)
-        value = bytes_to_hex(data[9:17], zero_padded=False)
-        address_physical = bytes_to_hex(data[17:], zero_padded=False)
-
-        if address == address_physical:
-            return f"{type.name} with address {address}, value {value}"
-        else:
-            return f"{type.name} with address {address} => {address_physical}, value {value}"
-
-
-    def parse_riscv_vector_configuration_data(self) -> str:
-        data = self.file.read(RISCV_VECTOR_CONFIGURATION_LENGTH)
+        return MemoryAccess(
+            MemoryAccessType(data[0]),
+            int.from_bytes(data[1:9], byteorder=BYTE_ORDER),
+            int.from_bytes(data[9:17], byteorder=BYTE_ORDER),
+            int.from_bytes(data[17:], byteorder=BYTE_ORDER),
+        )
+
+    def parse_riscv_vector_configuration_data(self, data: bytes) -> RiscVVectorConfiguration:
         if len(data) != RISCV_VECTOR_CONFIGURATION_LENGTH:
             raise InvalidFileFormatException("Unexpected end of file")
-        vl = bytes_to_hex(data[0:8], zero_padded=False)
-        vtype = bytes_to_hex(data[8:16], zero_padded=False)
-        return f"Vector configured to VL: {vl}, VTYPE: {vtype}"
-
-    def parse_riscv_atomic_instruction_data(self) -> str:
-        is_after_execution_raw = self.file.read(1)
-        width_raw = self.file.read(1)
-        instruction_raw = self.file.read(1)
-        if (
-            len(is_after_execution_raw) != 1
-            or len(width_raw) != 1
-            or len(instruction_raw) != 1
-        ):
+        return RiscVVectorConfiguration(int.from_bytes(data[0:8], byteorder=BYTE_ORDER), int.from_bytes(data[8:16], byteorder=BYTE_ORDER))
+
+    def parse_riscv_atomic_instruction_data(self, data: bytes) -> RiscVAtomicOperands:
+        if len(data) < RISCV_ATOMIC_INSTRUCTION_HEADER_LENGTH:
             raise InvalidFileFormatException("Invalid RISC-V atomic instruction data")
+        is_after_execution = bool(data[0])
+        word_size = get_atomic_word_size(data[1])
 
-        word_size = 0
-        width = RiscVAtomicInstructionWidth(width_raw[0])
-        if width == RiscVAtomicInstructionWidth.Word:
-            word_size = 4
-        if width == RiscVAtomicInstructionWidth.DoubleWord:
-            word_size = 8
-        if width == RiscVAtomicInstructionWidth.QuadWord:
-            raise InvalidFileFormatException("Support for QuadWord atomic operands not yet implemented")
-
-        data_size = 4 * word_size
-        data = self.file.read(data_size)
-        if len(data) != data_size:
+        data = data[RISCV_ATOMIC_INSTRUCTION_HEADER_LENGTH:]
+        if len(data) != 4 * word_size:
             raise InvalidFileFormatException("Unexpected end of file")
 
-        rd = bytes_to_hex(data[0 * word_size:1 * word_size], zero_padded=False)
-        rs1 = bytes_to_hex(data[1 * word_size:2 * word_size], zero_padded=False)
-        rs2 = bytes_to_hex(data[2 * word_size:3 * word_size], zero_padded=False)
-        memory_value = bytes_to_hex(data[3 * word_size:4 * word_size], zero_padded=False)
+        rd, rs1, rs2, memory_value = (int.from_bytes(data[i * word_size:(i + 1) * word_size], byteorder=BYTE_ORDER) for i in range(4))
+        return RiscVAtomicOperands(is_after_execution, rd, rs1, rs2, memory_value)
 
-        is_after_execution = is_after_execution_raw[0]
+    def parse_registers_data(self, data: bytes) -> Registers:
+        layout = self._registers_layouts.get(len(data))
+        if layout is not None and layout.matches(data, 0):
+            return layout.unpack(data)
 
-        prePostText = "after" if is_after_execution else "before"
-        return f"AMO operands {prePostText} - RD: {rd}, RS1: {rs1} (memory value: {memory_value}), RS2: {rs2}"
-
-    def parse_registers_data(self) -> str:
-        text = ""
         registers_data = []
         try:
-            pre_opcode = bool.from_bytes(self.file.read(1), byteorder = BYTE_ORDER)
-            if pre_opcode:
-                text = " Pre: "
-            else:
-                text = "Post: "
-
-            registers_count = int.from_bytes(self.file.read(1), byteorder = BYTE_ORDER)
-            if registers_count == 0:
-                raise ValueError("can't read registers number")
+            pre_opcode = bool(data[0])
 
+            registers_count = data[1]
+            position = 2
             for r in range(0, registers_count):
-                register_name_size = int.from_bytes(self.file.read(1), byteorder = BYTE_ORDER)
-                if register_name_size == 0:
-                    raise ValueError("register name size is 0")
+                register_name_size = data[position]
+                position += 1
 
                 try:
-                    register_name = self.file.read(register_name_size).decode("utf-8")
+                    register_name = str(data[position:position + register_name_size], "utf-8")
                 except UnicodeError:
                     raise InvalidFileFormatException("can't decode register name")
+                position += register_name_size
 
-                width = int.from_bytes(self.file.read(1), byteorder = BYTE_ORDER)
-                if width == 0:
-                    raise ValueError("register size is 0")
-
-                value = self.file.read(width)
+                width = data[position]
+                value = data[position + 1:position + 1 + width]
                 if (len(value) != width):
                     raise ValueError("can't read register data")
+                position += 1 + width
 
-                registers_data.append(f"{register_name}: {bytes_to_hex(value, zero_padded=False)}")
+                registers_data.append((register_name, int.from_bytes(value, byteorder=BYTE_ORDER)))
 
         except Exception as e:
             raise InvalidFileFormatException("Invalid registers data, " + str(e))
 
-        return text + " | ".join(registers_data)
+        if position == len(data):
+            self._registers_layouts[len(data)] = RegistersLayout(data)
+        return Registers(pre_opcode, registers_data)
+
+    def format_additional_data(self, data: AdditionalData) -> str:
+        if isinstance(data, MemoryAccess):
+            if data.address == data.address_physical:
+                return f"{data.type.name} with address 0x{data.address:X}, value 0x{data.value:X}"
+            return f"{data.type.name} with address 0x{data.address:X} => 0x{data.address_physical:X}, value 0x{data.value:X}"
+        if isinstance(data, RiscVVectorConfiguration):
+            return f"Vector configured to VL: 0x{data.vl:X}, VTYPE: 0x{data.vtype:X}"
+        if isinstance(data, RiscVAtomicOperands):
+            prePostText = "after" if data.is_after_execution else "before"
+            return f"AMO operands {prePostText} - RD: 0x{data.rd:X}, RS1: 0x{data.rs1:X} (memory value: 0x{data.memory_value:X}), RS2: 0x{data.rs2:X}"
+        text = " Pre: " if data.pre_opcode else "Post: "
+        return text + " | ".join(f"{name}: 0x{value:X}" for name, value in data.values)
 
     def format_entry(self, entry: TraceEntry) -> str:
         (pc, opcode, additional_data, triple_and_model) = entry
@@ -376,10 +987,68 @@ class TraceData:
             output += " " + instruction.decode("utf-8")
 
         if len(additional_data) > 0:
-            output += "\n" + "\n".join(additional_data)
+            output += "\n" + "\n".join(self.format_additional_data(data) for data in additional_data)
 
         return output
 
+    def filter_chunk(self, chunk: TraceChunk, entry_filter: EntryFilter) -> Iterable[int]:
+        # Filters are evaluated on the chunk's columns and the raw additional data, without decoding entries
+        indices: Iterable[int] = range(len(chunk))
+        if entry_filter.pc_range is not None:
+            low, high = entry_filter.pc_range
+            pcs = chunk.pc
+            indices = [i for i in indices if low <= pcs[i] < high]
+        if entry_filter.isas is not None:
+            isa_modes = {
+                isa_mode for isa_mode, triple_and_model in enumerate(self.triple_and_models)
+                if triple_and_model in entry_filter.isas or triple_and_model.split(" ")[0] in entry_filter.isas
+            }
+            indices = [i for i in indices if chunk.isa_mode[i] in isa_modes]
+        if entry_filter.opcode_mask is not None:
+            value, mask = entry_filter.opcode_mask
+            data = chunk.data
+            indices = [
+                i for i in indices
+                if int.from_bytes(data[chunk.opcode_offset[i]:chunk.opcode_offset[i] + chunk.opcode_length[i]], byteorder=BYTE_ORDER) & mask == value
+            ]
+        if entry_filter.filters_memory_accesses():
+            access_types = None if entry_filter.access_types is None else {access_type.value for access_type in entry_filter.access_types}
+            indices = [
+                i for i in indices
+                if self._has_memory_access(chunk.data, chunk.additional_data_offset[i], access_types, entry_filter.address_range)
+            ]
+        return indices
+
+    def _has_memory_access(self, buffer: bytes, position: int, access_types: Optional[set[int]], address_range: Optional[tuple[int, int]]) -> bool:
+        while position < len(buffer) and buffer[position] != AdditionalDataType.Empty.value:
+            additional_data_type = AdditionalDataType(buffer[position])
+            position += 1
+            if additional_data_type is AdditionalDataType.MemoryAccess and (access_types is None or buffer[position] in access_types):
+                if address_range is None:
+                    return True
+                low, high = address_range
+                if low <= int.from_bytes(buffer[position + 1:position + 9], byteorder=BYTE_ORDER) < high:
+                    return True
+            position += self._additional_data_length(additional_data_type, buffer, position)
+        return False
+
+    def iter_chunk_memory_accesses(self, chunk: TraceChunk) -> Generator[tuple[int, MemoryAccess], None, None]:
+        # Yields memory accesses of the chunk's entries, together with indices of these entries in the chunk
+        buffer = chunk.data
+        for index, position in enumerate(chunk.additional_data_offset):
+            while position < len(buffer) and buffer[position] != AdditionalDataType.Empty.value:
+                additional_data_type = AdditionalDataType(buffer[position])
+                position += 1
+                length = self._additional_data_length(additional_data_type, buffer, position)
+                if additional_data_type is AdditionalDataType.MemoryAccess:
+                    yield index, self.parse_memory_access_data(buffer[position:position + length])
+                position += length
+
+    def format_chunk(self, chunk: TraceChunk, indices: Optional[Iterable[int]] = None) -> str:
+        if indices is None:
+            indices = range(len(chunk))
+        return "\n".join(self.format_entry(self.get_chunk_entry(chunk, index)) for index in indices)
+
 
 class InvalidFileFormatException(Exception):
     pass
@@ -398,6 +1067,10 @@ class LLVMDisassembler():
         if not self._context:
             raise RuntimeError(f'Triple {triple} on CPU {cpu} not detected by LLVM. Disassembling will not be possible.')
 
+        self._output_buffer = create_string_buffer(DISASSEMBLY_BUFFER_SIZE)
+        # Traced code usually executes the same instructions over and over, so it's much cheaper to remember them than to call LLVM every time
+        self._get_cached_instruction = functools.lru_cache(maxsize=DISASSEMBLY_CACHE_SIZE)(self._disassemble)
+
     def __del__(self):
         if  hasattr(self, '_context'):
             self.lib.llvm_disasm_dispose(self._context)
@@ -412,49 +1085,308 @@ class LLVMDisassembler():
         self.lib.llvm_disasm_instruction.restype = c_size_t
 
     def get_instruction(self, opcode) -> tuple[int, bytes]:
+        return self._get_cached_instruction(bytes(opcode))
+
+    def cache_info(self) -> functools._CacheInfo:
+        return self._get_cached_instruction.cache_info()
+
+    def _disassemble(self, opcode: bytes) -> tuple[int, bytes]:
         opcode_buf = cast(c_char_p(opcode), POINTER(c_ubyte))
-        disas_str = cast((c_byte * 1024)(), c_char_p)
+        # The output buffer is reused, `value` returns a copy of its contents
+        bytes_read = self.lib.llvm_disasm_instruction(self._context, opcode_buf, c_uint64(len(opcode)), self._output_buffer, DISASSEMBLY_BUFFER_SIZE)
+        return (bytes_read, self._output_buffer.value)
+
+class BufferedTextOutput:
+    # Collects formatted text and writes it encoded to a binary stream in large blocks, instead of line by line
+    def __init__(self, stream: BinaryIO, size: int = OUTPUT_BUFFER_SIZE):
+        self.stream = stream
+        self.size = size
+        self._parts: list[str] = []
+        self._length = 0
+
+    def write(self, text: str) -> None:
+        self._parts.append(text)
+        self._length += len(text)
+        if self._length >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._parts:
+            self.stream.write("".join(self._parts).encode("utf-8"))
+            self._parts = []
+            self._length = 0
+
+
+def inspect_trace(trace_data: TraceData, stream: BinaryIO, start: int = 0, count: Optional[int] = None, entry_filter: Optional[EntryFilter] = None,
+                  sampling: Optional[EntrySampling] = None) -> None:
+    if entry_filter is not None:
+        if entry_filter.isas is not None and not trace_data.triple_and_models:
+            raise ValueError(f"Trace file {trace_data.file.name} doesn't contain ISA information required to filter entries by ISA")
+        if entry_filter.opcode_mask is not None and not trace_data.has_opcodes:
+            raise ValueError(f"Trace file {trace_data.file.name} doesn't contain opcodes required to filter entries by opcode")
+
+    index = trace_index.load_index(trace_data.file.name)
+    entry_ranges = [(start, count)]
+    if entry_filter is not None and entry_filter.pc_range is not None and index is not None and sampling is None:
+        # Decode only the parts of the trace that can contain PCs from the range
+        entry_ranges = index.find_pc_range(*entry_filter.pc_range, start, count)
+
+    output = BufferedTextOutput(stream)
+    for start, count in entry_ranges:
+        for chunk in iter_selected_chunks(trace_data, start, count, sampling, index):
+            if entry_filter is not None:
+                indices = trace_data.filter_chunk(chunk, entry_filter)
+                if indices:
+                    output.write(trace_data.format_chunk(chunk, indices) + "\n")
+            else:
+                output.write(trace_data.format_chunk(chunk) + "\n")
+            if trace_data.follow:
+                # Chunks end where the written part of the trace ends, so show them right away
+                output.flush()
+                stream.flush()
+    output.write("\n")
+    output.flush()
+
+
+def inspect_trace_file(trace_file: TraceFile, disassemble: bool, llvm_disas_path: Optional[str], start: int, count: Optional[int], entry_filter: Optional[EntryFilter],
+                       sampling: Optional[EntrySampling]) -> str:
+    # Used by worker processes, returns the path to a temporary file with the formatted trace
+    with trace_file.open() as file, tempfile.NamedTemporaryFile("wb", suffix=".txt", delete=False) as output:
+        trace_data = read_file(file, disassemble, llvm_disas_path, trace_file.use_mmap)
+        inspect_trace(trace_data, output, start, count, entry_filter, sampling)
+        return output.name
+
+
+def iter_selected_chunks(trace_data: TraceData, start: int, count: Optional[int], sampling: Optional[EntrySampling],
+                         index: Optional[TraceIndex]) -> Iterable[TraceChunk]:
+    if sampling is None:
+        return trace_data.iter_chunks(start=start, count=count, sidecar_index=index)
+    return trace_data.iter_sampled_chunks(sampling.iter_indices(start, count), index)
+
+
+def get_entry_filter(args) -> Optional[EntryFilter]:
+    entry_filter = EntryFilter(
+        args.pc_range,
+        args.address_range,
+        None if args.access_type is None else {MemoryAccessType[access_type] for access_type in args.access_type},
+        args.opcode_mask,
+        args.isa,
+    )
+    return None if entry_filter == EntryFilter() else entry_filter
+
+
+def get_entry_range(args) -> tuple[int, Optional[int]]:
+    start, count = getattr(args, 'start', 0), getattr(args, 'count', None)
+    if args.first is not None or args.window is not None:
+        if start != 0 or count is not None or (args.first is not None and args.window is not None):
+            raise ValueError("Only one of '--start' with '--count', '--first' and '--window' can be used")
+        start, count = (0, args.first) if args.first is not None else args.window
+    return start, count
+
+
+def get_entry_sampling(args) -> Optional[EntrySampling]:
+    if args.sample_every is None and args.random_sample is None:
+        return None
+    if args.sample_every is not None and args.sample_every < 1:
+        raise ValueError("Sampling interval has to be positive")
+    if args.random_sample is not None and not 0 < args.random_sample <= 1:
+        raise ValueError("Sampling probability has to be in the (0, 1] range")
+    return EntrySampling(args.sample_every or 1, args.random_sample, args.sample_seed)
+
+
+def handle_inspect(args, trace_files, trace_data_per_file) -> None:
+    entry_filter = get_entry_filter(args)
+    start, count = get_entry_range(args)
+    sampling = get_entry_sampling(args)
+    with contextlib.ExitStack() as stack:
+        if args.inspect_output:
+            _, file_extension = os.path.splitext(args.inspect_output)
+            stream = stack.enter_context(open_compressed_output(args.inspect_output, COMPRESSION_EXTENSIONS.get(file_extension, Compression.NONE)))
+        else:
+            stream = sys.stdout.buffer
 
-        bytes_read = self.lib.llvm_disasm_instruction(self._context, opcode_buf, c_uint64(len(opcode)), disas_str, 1024)
+        if args.jobs > 1 and len(trace_files) > 1:
+            with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                outputs = executor.map(
+                    inspect_trace_file, trace_files,
+                    *(itertools.repeat(arg) for arg in (args.disassemble, args.llvm_disas_path, start, count, entry_filter, sampling))
+                )
+                # Results are printed in the order of the files
+                for output_path in outputs:
+                    with open(output_path, "rb") as output:
+                        shutil.copyfileobj(output, stream, OUTPUT_BUFFER_SIZE)
+                    os.remove(output_path)
+            return
 
-        if disas_str.value is None:
-            raise RuntimeError("Unexpected null pointer when disassembling instruction")
+        for trace_data in trace_data_per_file:
+            inspect_trace(trace_data, stream, start, count, entry_filter, sampling)
 
-        return (bytes_read, disas_str.value)
+    if args.debug:
+        for triple_and_model, disas in TraceData.disassemblers.items():
+            print(f"Disassembly cache for {triple_and_model}: {disas.cache_info()}", file=sys.stderr)
 
-def handle_coverage(args, trace_data_per_file) -> None:
-    if args.coverage_binary_url:
-        fpath, _ = urllib.request.urlretrieve(args.coverage_binary_url)
-        elf_file_handle = open(fpath, "rb")
+
+def handle_export(args, trace_files, trace_data_per_file) -> None:
+    for trace_data in trace_data_per_file:
+        entry_count = export.export_trace(trace_data, args.export_output, args.format, args.row_group_size)
+        print(f"Exported {entry_count} entries of {trace_data.file.name} to {args.export_output}")
+
+
+def handle_stats(args, trace_files, trace_data_per_file) -> None:
+    start, count = get_entry_range(args)
+    sampling = get_entry_sampling(args)
+    if args.jobs > 1:
+        if (start, count, sampling) != (0, None, None):
+            raise ValueError("Statistics of a part or a sample of the trace can't be collected with '--jobs'")
+        collect = functools.partial(trace_stats.collect_statistics, page_size=args.page_size)
+        statistics_per_file = map_trace_files(trace_files, trace_data_per_file, collect, args.jobs)
     else:
-        elf_file_handle = args.coverage_binary
+        statistics_per_file = (
+            [trace_stats.collect_statistics(
+                trace_data,
+                iter_selected_chunks(trace_data, start, count, sampling, trace_index.load_index(trace_data.file.name)),
+                args.page_size,
+            )]
+            for trace_data in trace_data_per_file
+        )
+
+    for trace_data, statistics_per_range in zip(trace_data_per_file, statistics_per_file):
+        statistics = statistics_per_range[0]
+        for range_statistics in statistics_per_range[1:]:
+            statistics.merge(range_statistics)
+        print(f"Trace file {trace_data.file.name}")
+        print(statistics.format(trace_data.triple_and_models, args.top))
+        print()
+
+
+def handle_diff(args, trace_files, trace_data_per_file) -> None:
+    diff = trace_diff.diff_traces(*trace_data_per_file, args.window)
+    print(trace_diff.format_diff(diff, args.context))
+    if diff.divergence is not None:
+        # Same as diff, signal that the traces differ with 1, errors are signaled with 2
+        sys.exit(1)
 
-    coverage_config = coverage.Coverage(
-        elf_file_handler=elf_file_handle,
-        pc2line_file_stream=args.pc2line_file,
-        code_filenames=args.coverage_code,
-        substitute_paths=args.sub_source_path,
-        ignore_paths=args.ignore_paths,
-        test_name=args.test_name,
-        debug=args.debug,
-        print_unmatched_address=args.print_unmatched_address,
-        lazy_line_cache=args.lazy_line_cache,
-        load_whole_code_lines=args.legacy,
-    )
 
-    remove_common_path_prefix = args.export_for_coverview
-    if args.no_shorten_paths:
-        remove_common_path_prefix = False
+def handle_profile(args, trace_files, trace_data_per_file) -> None:
+    symbols = trace_profile.SymbolIndex(args.profile_binary)
+    profile = trace_profile.Profile(symbols)
+    profiler = trace_profile.Profiler(profile)
+    for trace_data in trace_data_per_file:
+        if not trace_data.has_pc:
+            raise ValueError(f"Trace {trace_data.file.name} doesn't contain PCs, which are required to profile it")
+        profiler.profile_trace(trace_data)
+
+    print(profile.format(args.top))
+    if args.folded_output:
+        with open(args.folded_output, "w") as folded_file:
+            profile.write_folded_stacks(folded_file)
 
+
+def handle_index(args, trace_files, trace_data_per_file) -> None:
     for trace_data in trace_data_per_file:
-        coverage_config.aggregate_coverage(trace_data)
+        index = trace_index.build_index(trace_data, trace_data.file.name, args.interval)
+        index_path = trace_index.get_index_path(trace_data.file.name)
+        with open(index_path, "wb") as index_file:
+            index.save(index_file)
+        print(f"Created index {index_path} with {len(index.checkpoint_entry)} checkpoints for {index.entry_count} entries")
+
+
+T = TypeVar("T")
+
+
+class TraceSplitError(Exception):
+    pass
+
+
+class TraceRange(NamedTuple):
+    trace_file: TraceFile
+    start: int
+    count: Optional[int]
+    sidecar_index: Optional[TraceIndex]
+    # If set, all entries in the range are expected to have this length, which is verified while decoding
+    entry_length: int = 0
+
+
+def split_trace(trace_file: TraceFile, trace_data: TraceData, parts: int) -> list[TraceRange]:
+    # Decoding can be started in the middle of the trace only at entries, whose offsets are known without decoding the preceding ones.
+    # These are index checkpoints or, if all entries have the same length, any entry.
+    whole_trace = [TraceRange(trace_file, 0, None, None)]
+    if parts < 2 or trace_file.compression != Compression.NONE:
+        return whole_trace
+
+    entry_length = 0
+    index = trace_index.load_index(trace_file.path)
+    if index is None:
+        if trace_data.has_opcodes or trace_data.multiple_triple_and_models:
+            return whole_trace
+        # Entries with only PCs have the same length, unless they contain additional data
+        entry_length = trace_data.pc_length + 1
+        index = trace_index.create_fixed_length_index(trace_file.path, HEADER_LENGTH + trace_data.extra_length, entry_length, READ_BUFFER_SIZE // entry_length)
+
+    checkpoints = index.checkpoint_entry
+    starts = sorted({checkpoints[len(checkpoints) * part // parts] for part in range(parts) if checkpoints})
+    if len(starts) < 2:
+        return whole_trace
+    counts = [end - start for start, end in zip(starts, starts[1:])] + [None]
+    return [TraceRange(trace_file, start, count, index, entry_length) for start, count in zip(starts, counts)]
+
+
+def verify_entry_length(chunks: Iterable[TraceChunk], entry_length: int) -> Generator[TraceChunk, None, None]:
+    expected_offset = None
+    for chunk in chunks:
+        if expected_offset is None:
+            expected_offset = chunk.get_file_offset(0)
+        last = len(chunk) - 1
+        # If any entry contained additional data, offsets of the following ones would be shifted
+        if chunk.get_file_offset(0) != expected_offset or chunk.offset[last] - chunk.offset[0] != last * entry_length \
+                or chunk.data[chunk.additional_data_offset[last]] != AdditionalDataType.Empty.value:
+            raise TraceSplitError("Trace entries don't have the same length")
+        expected_offset += len(chunk) * entry_length
+        yield chunk
+
+
+def process_trace_range(trace_range: TraceRange, function: Callable[[TraceData, Iterable[TraceChunk]], T]) -> T:
+    # Used by worker processes
+    with trace_range.trace_file.open() as file:
+        trace_data = read_file(file, False, None, trace_range.trace_file.use_mmap)
+        chunks = trace_data.iter_chunks(start=trace_range.start, count=trace_range.count, sidecar_index=trace_range.sidecar_index)
+        if not trace_range.entry_length:
+            return function(trace_data, chunks)
+        try:
+            return function(trace_data, verify_entry_length(chunks, trace_range.entry_length))
+        except (ValueError, RuntimeError, InvalidFileFormatException) as err:
+            # The range doesn't start at an entry, as some of the previous entries had different length
+            raise TraceSplitError("Trace entries don't have the same length") from err
+
+
+def map_trace_files(trace_files: list[TraceFile], trace_data_per_file: list[TraceData], function: Callable[[TraceData, Iterable[TraceChunk]], T], jobs: int) -> Generator[list[T], None, None]:
+    """
+    Apply `function` to chunks of all trace files in a process pool, yielding results for each file in their order.
+    Results for ranges of a file are in the order of the ranges.
+    Traces are split into ranges of entries processed independently when possible, so there are several results per file.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures_per_file = [
+            [executor.submit(process_trace_range, trace_range, function) for trace_range in split_trace(trace_file, trace_data, jobs)]
+            for trace_file, trace_data in zip(trace_files, trace_data_per_file)
+        ]
+        for trace_file, futures in zip(trace_files, futures_per_file):
+            try:
+                yield [future.result() for future in futures]
+            except TraceSplitError:
+                yield [executor.submit(process_trace_range, TraceRange(trace_file, 0, None, None), function).result()]
+
+
+def write_coverage_report(args, coverage_config: coverage.Coverage, remove_common_path_prefix: bool, snapshot: bool = False) -> bool:
+    # Snapshots are written to a temporary file first, so that the output file is never seen partially written
     printed_report = coverage_config.get_printed_report(
         args.legacy,
         remove_common_path_prefix=remove_common_path_prefix
     )
 
     if args.coverage_output != None:
-        with open(args.coverage_output, 'w') as coverage_output:
+        output_path = args.coverage_output + ".tmp" if snapshot else args.coverage_output
+        with open(output_path, 'w') as coverage_output:
             if args.export_for_coverview:
                 archive_created = coverview_integration.create_coverview_archive(
                     coverage_output,
@@ -465,19 +1397,109 @@ def handle_coverage(args, trace_data_per_file) -> None:
                     remove_common_path_prefix=remove_common_path_prefix,
                 )
                 if not archive_created:
-                    sys.exit(1)
+                    return False
             else:
                 for line in printed_report:
                     coverage_output.write(f"{line}\n")
+        if snapshot:
+            os.replace(output_path, args.coverage_output)
     else:
         for line in printed_report:
             print(line)
+    return True
+
+
+def count_trace_addresses(args, trace_files, trace_data_per_file) -> Generator[Counter[int], None, None]:
+    # Yields the number of executions of each address, for each of the traces in their order
+    for trace_data in trace_data_per_file:
+        if not trace_data.has_pc:
+            raise ValueError("The trace data doesn't contain PCs.")
+    if args.jobs > 1:
+        # Workers only count executions of unique addresses, mapping them to code lines is done here, in the order of the files
+        results = map_trace_files(trace_files, trace_data_per_file, coverage.count_chunk_addresses, args.jobs)
+        for trace_data, address_counts_per_range in zip(trace_data_per_file, results):
+            print(f'Merging coverage of trace file {trace_data.file.name}')
+            address_counts = Counter()
+            for range_address_counts in address_counts_per_range:
+                address_counts.update(range_address_counts)
+            yield address_counts
+    else:
+        for trace_data in trace_data_per_file:
+            print(f'Processing trace file {trace_data.file.name}, please wait...')
+            yield coverage.count_addresses(trace_data)
+
+
+def handle_coverage(args, trace_files, trace_data_per_file) -> None:
+    if args.coverage_binary_url:
+        fpath, _ = urllib.request.urlretrieve(args.coverage_binary_url)
+        elf_file_handle = open(fpath, "rb")
+    else:
+        elf_file_handle = args.coverage_binary
+
+    # The key has to be computed before the pc2line file is read by the coverage
+    binary_key = coverage_database.get_binary_key(elf_file_handle, args.pc2line_file) if args.coverage_database else None
+
+    coverage_config = coverage.Coverage(
+        elf_file_handler=elf_file_handle,
+        pc2line_file_stream=args.pc2line_file,
+        code_filenames=args.coverage_code,
+        substitute_paths=args.sub_source_path,
+        ignore_paths=args.ignore_paths,
+        test_name=args.test_name,
+        debug=args.debug,
+        print_unmatched_address=args.print_unmatched_address,
+        lazy_line_cache=args.lazy_line_cache,
+        load_whole_code_lines=args.legacy,
+        jobs=args.jobs,
+        line_table_cache_directory=args.line_table_cache,
+    )
+
+    remove_common_path_prefix = args.export_for_coverview
+    if args.no_shorten_paths:
+        remove_common_path_prefix = False
+
+    if args.coverage_database:
+        # Only the given traces are decoded, the report also includes all runs stored earlier for the binary and the test name
+        # Traces are identified by their absolute paths, so that traces with the same name in different directories are kept apart
+        traces = [args.coverage_label or os.path.abspath(trace_file.path) for trace_file in trace_files]
+        with coverage_database.CoverageDatabase(args.coverage_database) as database:
+            existing_runs = database.find_existing_runs(binary_key, args.test_name, traces)
+            if existing_runs and not args.replace_runs:
+                raise ValueError(
+                    f"Trace {existing_runs[0]} of the test '{args.test_name}' is already in the database {args.coverage_database}, use '--replace' to replace it"
+                )
+            address_counts_per_file = count_trace_addresses(args, trace_files, trace_data_per_file)
+            for trace, trace_data, address_counts in zip(traces, trace_data_per_file, address_counts_per_file):
+                database.add_run(binary_key, args.test_name, trace, args.coverage_label or trace_data.filename, address_counts, replace=args.replace_runs)
+            for label, address_counts in database.iter_runs(binary_key, args.test_name):
+                coverage_config.aggregate_address_counts(address_counts, label)
+    elif args.follow:
+        for trace_data in trace_data_per_file:
+            for _ in coverage_config.aggregate_coverage_snapshots(trace_data, args.snapshot_interval):
+                write_coverage_report(args, coverage_config, remove_common_path_prefix, snapshot=True)
+    elif args.jobs > 1:
+        for trace_data, address_counts in zip(trace_data_per_file, count_trace_addresses(args, trace_files, trace_data_per_file)):
+            coverage_config.aggregate_address_counts(address_counts, trace_data.filename)
+    else:
+        for trace_data in trace_data_per_file:
+            coverage_config.aggregate_coverage(trace_data)
+    if not write_coverage_report(args, coverage_config, remove_common_path_prefix):
+        sys.exit(1)
 
     if args.coverage_binary_url:
         elf_file_handle.close()
         urllib.request.urlcleanup()
 
 
+def handle_coverage_merge(args) -> None:
+    with coverage_database.CoverageDatabase(args.merge_output) as database:
+        for path in args.databases:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Coverage database {path} doesn't exist")
+            run_count = database.merge(path, replace=args.replace_runs)
+            print(f'Merged {run_count} runs from {path}')
+
+
 def find_llvm_disas() -> str:
     uname = platform.uname()
 
@@ -520,31 +1542,100 @@ def find_llvm_disas() -> str:
             break
 
     if llvm_disas_path is None:
-        raise FileNotFoundError('Could not find libllvm-disas in any of the following locations: ' + ', '.join([os.path.join(path.abspath(ppath), rid) for ppath in lib_search_paths]))
+        raise FileNotFoundError('Could not find libllvm-disas in any of the following locations: ' + ', '.join([os.path.join(os.path.abspath(ppath), rid) for ppath in lib_search_paths]))
     
     return llvm_disas_path
 
+def add_entry_selection_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--first", default=None, type=int, help="process only the given number of entries from the start of the trace")
+    parser.add_argument("--window", default=None, type=parse_entry_window,
+        help="process only entries in the window, in the start:count format; a sidecar index is used to seek to the start")
+    sampling_group = parser.add_mutually_exclusive_group()
+    sampling_group.add_argument("--sample-every", default=None, type=int,
+        help="process only every N-th entry, entries between samples are skipped without decoding them")
+    sampling_group.add_argument("--random-sample", default=None, type=float, help="process each entry with the given probability")
+    parser.add_argument("--sample-seed", default=None, type=int, help="seed of the random sampling, for repeatable samples")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Renode's ExecutionTracer binary format reader")
     parser.add_argument("--debug", default=False, action="store_true", help="enable additional debug logs to stdout")
     parser.add_argument("--decompress", action="store_true", default=False,
-        help="decompress trace file, without the flag decompression is enabled based on a file extension")
+        help="decompress trace files as gzip, without the flag the compression (gzip, zstd or lz4) is detected based on the file contents or extension")
     parser.add_argument("--force-disable-decompression", action="store_true", default=False, help="never attempt to decompress the trace file")
+    parser.add_argument("--mmap", action="store_true", default=False,
+        help="memory-map uncompressed trace files instead of reading them, entries are decoded without copying their data")
 
     subparsers = parser.add_subparsers(title='subcommands', dest='subcommands', required=True)
     trace_parser = subparsers.add_parser('inspect', help='Inspect the binary trace format')
     trace_parser.add_argument("files", nargs='+', help="binary trace files")
 
+    trace_parser.add_argument("--jobs", default=1, type=int, help="number of trace files processed in parallel")
+    trace_parser.add_argument("--output", dest='inspect_output', default=None, type=str,
+        help="path to the output file instead of the standard output, compressed if it has a .gz, .zst or .lz4 extension")
     trace_parser.add_argument("--disassemble", action="store_true", default=False)
     trace_parser.add_argument("--llvm-disas-path", default=None, help="path to libllvm-disas library")
+    trace_parser.add_argument("--follow", default=False, action="store_true", help="keep printing entries appended to the trace, e.g. while Renode is still writing it")
+    trace_parser.add_argument("--follow-timeout", default=None, type=float, help="stop following the trace if it doesn't grow for the given number of seconds")
+    trace_parser.add_argument("--start", default=0, type=int, help="number of the first entry to print")
+    trace_parser.add_argument("--count", default=None, type=int, help="number of entries to print")
+    trace_parser.add_argument("--pc-range", default=None, type=parse_address_range,
+        help="print only entries with PCs in the range, in the start:end format (end excluded)")
+    trace_parser.add_argument("--address-range", default=None, type=parse_address_range,
+        help="print only entries with memory accesses to addresses in the range, in the start:end format (end excluded)")
+    trace_parser.add_argument("--access-type", default=None, action="append", choices=[access_type.name for access_type in MemoryAccessType],
+        help="print only entries with memory accesses of the given type, can be used multiple times")
+    trace_parser.add_argument("--opcode-mask", default=None, type=parse_opcode_mask,
+        help="print only entries with opcodes matching the value on bits set in the mask, in the value/mask format")
+    trace_parser.add_argument("--isa", default=None, action="append",
+        help="print only entries executed in the given ISA, as a triple or a triple and a model, can be used multiple times")
+
+    add_entry_selection_arguments(trace_parser)
+
+    index_parser = subparsers.add_parser('index', help='Create sidecar indices allowing to quickly seek in the trace files')
+    index_parser.add_argument("files", nargs='+', help="binary trace files")
+    index_parser.add_argument("--interval", default=trace_index.DEFAULT_INDEX_INTERVAL, type=int, help="number of entries between index checkpoints")
+
+    export_parser = subparsers.add_parser('export', help='Export the trace to a columnar file for data analysis tools')
+    export_parser.add_argument("files", nargs=1, help="binary trace file")
+    export_parser.add_argument("--output", dest='export_output', required=True, type=str,
+        help="path to the output file, memory accesses are written to a separate '.memory_accesses' file for Parquet and Arrow")
+    export_parser.add_argument("--format", default=None, choices=sorted(set(export.EXPORT_FORMATS.values())),
+        help="output format, without the flag it's based on the output file extension")
+    export_parser.add_argument("--row-group-size", default=export.DEFAULT_ROW_GROUP_SIZE, type=int, help="number of entries buffered and written at once")
+
+    stats_parser = subparsers.add_parser('stats', help='Print statistics of the trace')
+    stats_parser.add_argument("files", nargs='+', help="binary trace files")
+    stats_parser.add_argument("--jobs", default=1, type=int, help="number of parallel jobs, uncompressed traces with an index or with only PCs are also split between jobs")
+    stats_parser.add_argument("--top", default=trace_stats.DEFAULT_TOP_COUNT, type=int, help="number of the hottest PCs and memory pages to print")
+    stats_parser.add_argument("--page-size", default=trace_stats.DEFAULT_PAGE_SIZE, type=lambda s: int(s, 0), help="size of pages memory accesses are grouped by")
+
+    add_entry_selection_arguments(stats_parser)
+
+    diff_parser = subparsers.add_parser('diff', help='Find the first entry that differs between two traces, exit with 1 if they differ and with 2 on errors')
+    diff_parser.add_argument("files", nargs=2, help="binary trace files")
+    diff_parser.add_argument("--context", default=trace_diff.DEFAULT_DIFF_CONTEXT, type=int, help="number of entries printed before and after the first difference")
+    diff_parser.add_argument("--window", default=trace_diff.DEFAULT_DIFF_WINDOW, type=int, help="number of entries compared at once")
+
+    profile_parser = subparsers.add_parser('profile', help='Count instructions executed in each function and infer call stacks')
+    profile_parser.add_argument("files", nargs='+', help="binary trace files")
+    profile_parser.add_argument("--binary", dest='profile_binary', required=True, type=argparse.FileType('rb'), help="path to an ELF file with function symbols")
+    profile_parser.add_argument("--top", default=trace_profile.DEFAULT_PROFILE_TOP_COUNT, type=int, help="number of functions with the most executed instructions to print")
+    profile_parser.add_argument("--folded-output", default=None, type=str,
+        help="path to a file with folded stacks, which can be turned into a flame graph e.g. with flamegraph.pl")
 
     cov_parser = subparsers.add_parser('coverage', help='Generate coverage reports')
-    cov_parser.add_argument("files", nargs='+', help="binary trace files")
+    cov_parser.add_argument("files", nargs='*', help="binary trace files, they can be omitted to only create the report from '--database'")
 
     source_map_parser = cov_parser.add_mutually_exclusive_group(required=True)
     source_map_parser.add_argument("--binary", dest='coverage_binary', default=None, type=argparse.FileType('rb'), help="path to an ELF file with DWARF data")
     source_map_parser.add_argument("--binary-url", dest='coverage_binary_url', default=None, type=str, help="Network address to an ELF file with DWARF data")
     source_map_parser.add_argument("--pc2line", dest='pc2line_file', default=None, type=argparse.FileType('r'), help="path to a file containing PC to line number mappings")
+    cov_parser.add_argument("--jobs", default=1, type=int, help="number of parallel jobs, uncompressed traces with an index or with only PCs are also split between jobs")
+    cov_parser.add_argument("--follow", default=False, action="store_true",
+        help="keep processing entries appended to the trace, e.g. while Renode is still writing it, and periodically write the report")
+    cov_parser.add_argument("--follow-timeout", default=None, type=float, help="stop following the trace if it doesn't grow for the given number of seconds")
+    cov_parser.add_argument("--snapshot-interval", default=coverage.DEFAULT_SNAPSHOT_INTERVAL, type=float, help="minimal number of seconds between reports written in the follow mode")
     cov_parser.add_argument("--sources", dest='coverage_code', default=None, nargs='+', type=str, help="path to a (list of) source file(s)")
     cov_parser.add_argument("--output", dest='coverage_output', default=None, type=str, help="path to the output coverage file")
     cov_parser.add_argument("--name", dest='test_name', default="", type=str, help="Provide test name")
@@ -554,32 +1645,71 @@ def main():
     cov_parser.add_argument("--print-unmatched-address", default=False, action="store_true", help="Print addresses not matched to any source lines")
     cov_parser.add_argument("--sub-source-path", default=[], nargs='*', action='extend', type=coverage.PathSubstitution.from_arg, help="Substitute a part of sources' path. Format is: old_path:new_path")
     cov_parser.add_argument("--ignore-paths", default=[], nargs='*', action='extend', help='Ignore source files matching pattern(s)')
-    cov_parser.add_argument("--lazy-line-cache", default=False, action="store_true", help="Disable line to address eager cache generation. For big programs, reduce memory usage, but process traces much slower")
+    cov_parser.add_argument("--lazy-line-cache", default=False, action="store_true", help="Deprecated, has no effect. Addresses are mapped to lines with an index of address ranges, which doesn't need to be disabled for big programs")
+    cov_parser.add_argument("--line-table-cache", default=None, nargs='?', const=dwarf.get_default_cache_directory(), metavar="DIRECTORY",
+        help="cache line tables extracted from DWARF data of binaries in the directory, 'renode-retracer/line-tables' in '$XDG_CACHE_HOME' "
+             "(or in '~/.cache') if it isn't given; line tables aren't cached without the option")
     cov_parser.add_argument("--no-shorten-paths", default=False, action="store_true", help="Disable removing common path prefix from coverage output. Only relevant with '--export-for-coverview'")
     cov_parser.add_argument("--tests-as-total", default=False, action="store_true", help="Show executed tests out of total tests in line coverage in coverview. Only relevant with '--export-for-coverview'")
     cov_parser.add_argument("--warning-threshold", required=False, help="Set warning threshold for line coverage in coverview. Only relevant with '--export-for-coverview'")
+    cov_parser.add_argument("--database", dest='coverage_database', default=None, type=str,
+        help="SQLite database the executions of the traces are added to, the report includes all traces of the binary and the test name stored there")
+    cov_parser.add_argument("--label", dest='coverage_label', default=None, type=str,
+        help="label identifying the trace in '--database' and in reports, instead of the trace's path and name; only for a single trace")
+    cov_parser.add_argument("--replace", dest='replace_runs', default=False, action="store_true",
+        help="replace traces that are already in '--database', by default adding them again is an error")
+
+    merge_parser = subparsers.add_parser('coverage-merge', help="Merge coverage databases created with the '--database' option of 'coverage'")
+    merge_parser.add_argument("databases", nargs='+', help="coverage databases to merge")
+    merge_parser.add_argument("--output", dest='merge_output', required=True, type=str,
+        help="database the runs are merged into, it's created if it doesn't exist")
+    merge_parser.add_argument("--replace", dest='replace_runs', default=False, action="store_true",
+        help="replace runs of the same binary, test name and trace that are already in the output database, by default they are an error")
+    merge_parser.set_defaults(files=[])
     args = parser.parse_args()
 
     # Look for the libllvm-disas library in default location
     if args.subcommands == 'inspect' and args.disassemble and args.llvm_disas_path is None:
         args.llvm_disas_path = find_llvm_disas()
 
+    # The diff subcommand exits with 1 if the traces differ, so its errors have to be told apart from that
+    error_exit_code = 2 if args.subcommands == 'diff' else 1
+
+    def exit_with_error(message: str) -> NoReturn:
+        print(message, file=sys.stderr)
+        sys.exit(error_exit_code)
+
     try:
         with contextlib.ExitStack() as stack:
-            files = []
+            trace_files = []
             for file in args.files:
-                _, file_extension = os.path.splitext(file)
-                if (args.decompress or file_extension == ".gz") and not args.force_disable_decompression:
-                    files.append(stack.enter_context(gzip.open(file, "rb")))
-                else:
-                    files.append(stack.enter_context(open(file, "rb")))
-
-            if args.subcommands == 'coverage':
-                trace_data_per_file = [read_file(file, False, None) for file in files]
+                compression = Compression.NONE
+                if not args.force_disable_decompression:
+                    _, file_extension = os.path.splitext(file)
+                    compression = detect_compression(file)
+                    if compression == Compression.NONE:
+                        compression = COMPRESSION_EXTENSIONS.get(file_extension, Compression.GZIP if args.decompress else Compression.NONE)
+                trace_files.append(TraceFile(file, compression, args.mmap and compression == Compression.NONE))
+            files = [stack.enter_context(trace_file.open()) for trace_file in trace_files]
+
+            if args.subcommands == 'inspect':
+                trace_data_per_file = [read_file(file, args.disassemble, args.llvm_disas_path, trace_file.use_mmap) for file, trace_file in zip(files, trace_files)]
             else:
-                trace_data_per_file = [read_file(file, args.disassemble, args.llvm_disas_path) for file in files]
+                trace_data_per_file = [read_file(file, False, None, trace_file.use_mmap) for file, trace_file in zip(files, trace_files)]
+
+            if getattr(args, 'follow', False):
+                if args.jobs > 1:
+                    raise ValueError("Following traces can't be used with '--jobs'")
+                for trace_data in trace_data_per_file:
+                    trace_data.enable_follow(args.follow_timeout)
 
             if args.subcommands == 'coverage':
+                if not args.files and not args.coverage_database:
+                    raise ValueError("Specify trace files, or a coverage database with '--database' to create the report from")
+                if args.follow and args.coverage_database:
+                    raise ValueError("Following traces can't be used with '--database'")
+                if args.coverage_label is not None and len(args.files) > 1:
+                    raise ValueError("'--label' can only be used with a single trace file")
                 if args.export_for_coverview:
                     if args.legacy:
                         print("'--export-for-coverview' implies LCOV-compatible format")
@@ -587,23 +1717,32 @@ def main():
                     if not args.coverage_output:
                         raise ValueError("Specify a file with '--output' when packing an archive for Coverview")
 
-                handle_coverage(args, trace_data_per_file)
+                handle_coverage(args, trace_files, trace_data_per_file)
+            elif args.subcommands == 'index':
+                handle_index(args, trace_files, trace_data_per_file)
+            elif args.subcommands == 'export':
+                handle_export(args, trace_files, trace_data_per_file)
+            elif args.subcommands == 'stats':
+                handle_stats(args, trace_files, trace_data_per_file)
+            elif args.subcommands == 'diff':
+                handle_diff(args, trace_files, trace_data_per_file)
+            elif args.subcommands == 'profile':
+                handle_profile(args, trace_files, trace_data_per_file)
+            elif args.subcommands == 'coverage-merge':
+                handle_coverage_merge(args)
             else:
-                for trace_data in trace_data_per_file:
-                    for entry in trace_data:
-                        print(trace_data.format_entry(entry))
-                    print()
+                handle_inspect(args, trace_files, trace_data_per_file)
     except BrokenPipeError:
         # Avoid crashing when piping the results e.g. to less
         sys.exit(0)
-    except (ValueError, RuntimeError) as err:
-        sys.exit(f"Error during execution: {err}")
+    except (ValueError, RuntimeError, sqlite3.Error) as err:
+        exit_with_error(f"Error during execution: {err}")
     except (FileNotFoundError, InvalidFileFormatException) as err:
-        sys.exit(f"Error while loading file: {err}")
+        exit_with_error(f"Error while loading file: {err}")
     except (urllib.error.URLError, urllib.error.HTTPError) as err:
-        sys.exit(f"Error while fetching file: {err}")
+        exit_with_error(f"Error while fetching file: {err}")
     except KeyboardInterrupt:
-        sys.exit(1)
+        sys.exit(error_exit_code)
 
 if __name__ == "__main__":
     main()
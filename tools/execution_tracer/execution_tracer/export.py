@@ -0,0 +1,278 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from abc import ABC, abstractmethod
+from array import array
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, BinaryIO, Optional
+
+if TYPE_CHECKING:
+    from execution_tracer.execution_tracer_reader import TraceChunk, TraceData
+
+# Number of entries buffered before they are written out as a single row group
+DEFAULT_ROW_GROUP_SIZE = 1024 * 1024
+
+EXPORT_FORMATS = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".npz": "npz",
+}
+
+MEMORY_ACCESS_COLUMNS = ("entry", "type", "address", "value", "address_physical")
+# Type codes of `array` columns, memory access columns are prefixed with "memory_" in the NPZ archive
+NPY_DESCRIPTORS = {"B": "|u1", "Q": "<u8"}
+
+
+def get_export_format(path: str) -> str:
+    _, file_extension = os.path.splitext(path)
+    if file_extension not in EXPORT_FORMATS:
+        raise ValueError(f"Can't determine the export format of {path}, use one of the {', '.join(EXPORT_FORMATS)} extensions or '--format'")
+    return EXPORT_FORMATS[file_extension]
+
+
+def get_memory_access_path(path: str) -> str:
+    # Parquet and Arrow files hold a single table, so memory accesses are written next to the entries
+    base, file_extension = os.path.splitext(path)
+    return f"{base}.memory_accesses{file_extension}"
+
+
+@dataclass
+class RowGroup:
+    """
+    Entries and memory accesses buffered before they are written out.
+
+    Memory accesses are flattened into a separate table, with each row referring to its entry by the entry's number.
+    """
+    entry: array = field(default_factory=lambda: array("Q"))
+    pc: array = field(default_factory=lambda: array("Q"))
+    # Opcodes are stored back to back, `opcode_end` holds the end of each one
+    opcode: bytearray = field(default_factory=bytearray)
+    opcode_end: array = field(default_factory=lambda: array("Q"))
+    isa_mode: array = field(default_factory=lambda: array("B"))
+    memory_entry: array = field(default_factory=lambda: array("Q"))
+    memory_type: array = field(default_factory=lambda: array("B"))
+    memory_address: array = field(default_factory=lambda: array("Q"))
+    memory_value: array = field(default_factory=lambda: array("Q"))
+    memory_address_physical: array = field(default_factory=lambda: array("Q"))
+
+    def __len__(self) -> int:
+        return len(self.entry)
+
+    def append_chunk(self, trace_data: TraceData, chunk: TraceChunk) -> None:
+        self.entry.extend(range(chunk.start_index, chunk.start_index + len(chunk)))
+        self.pc.extend(chunk.pc)
+        self.isa_mode.extend(chunk.isa_mode)
+        if trace_data.has_opcodes:
+            data = chunk.data
+            for offset, length in zip(chunk.opcode_offset, chunk.opcode_length):
+                self.opcode += data[offset:offset + length]
+                self.opcode_end.append(len(self.opcode))
+        else:
+            self.opcode_end.extend(0 for _ in range(len(chunk)))
+
+        for index, memory_access in trace_data.iter_chunk_memory_accesses(chunk):
+            self.memory_entry.append(chunk.start_index + index)
+            self.memory_type.append(memory_access.type.value)
+            self.memory_address.append(memory_access.address)
+            self.memory_value.append(memory_access.value)
+            self.memory_address_physical.append(memory_access.address_physical)
+
+    def get_opcodes_as_integers(self) -> array:
+        opcodes = array("Q")
+        start = 0
+        for end in self.opcode_end:
+            if end - start > 8:
+                raise ValueError("Opcodes longer than 8 bytes can't be exported to NPZ, use Parquet or Arrow instead")
+            opcodes.append(int.from_bytes(self.opcode[start:end], byteorder="little"))
+            start = end
+        return opcodes
+
+
+class TraceExporter(ABC):
+    def __init__(self, path: str, trace_data: TraceData):
+        self.path = path
+        self.trace_data = trace_data
+
+    @abstractmethod
+    def write_row_group(self, row_group: RowGroup) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def abort(self) -> None:
+        # Called instead of `close` after an error, output files are removed so that a partial export isn't mistaken for a complete one
+        pass
+
+
+class NpzExporter(TraceExporter):
+    """
+    Writes columns as .npy files in a ZIP archive, in the same layout as `numpy.savez`, without requiring NumPy.
+
+    The .npy header contains the length of the column, so columns are streamed to temporary files first,
+    and the archive is put together once the whole trace is processed.
+    Opcodes are stored as little-endian integers with their lengths in the `opcode_length` column.
+    """
+    def __init__(self, path: str, trace_data: TraceData):
+        super().__init__(path, trace_data)
+        self._directory = tempfile.TemporaryDirectory()
+        self._columns: dict[str, tuple[str, BinaryIO]] = {}
+        self._lengths: dict[str, int] = {}
+
+    def _write_column(self, name: str, column: array) -> None:
+        if name not in self._columns:
+            self._columns[name] = (column.typecode, open(os.path.join(self._directory.name, name), "wb"))
+            self._lengths[name] = 0
+        if sys.byteorder != "little":
+            column = array(column.typecode, column)
+            column.byteswap()
+        column.tofile(self._columns[name][1])
+        self._lengths[name] += len(column)
+
+    def write_row_group(self, row_group: RowGroup) -> None:
+        starts = array("Q", [0, *row_group.opcode_end[:-1]])
+        self._write_column("entry", row_group.entry)
+        self._write_column("pc", row_group.pc)
+        self._write_column("opcode", row_group.get_opcodes_as_integers())
+        self._write_column("opcode_length", array("B", (end - start for start, end in zip(starts, row_group.opcode_end))))
+        self._write_column("isa_mode", row_group.isa_mode)
+        for name in MEMORY_ACCESS_COLUMNS:
+            self._write_column(f"memory_{name}", getattr(row_group, f"memory_{name}"))
+
+    def close(self) -> None:
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, (typecode, file) in self._columns.items():
+                file.close()
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member, open(file.name, "rb") as column:
+                    member.write(get_npy_header(NPY_DESCRIPTORS[typecode], self._lengths[name]))
+                    shutil.copyfileobj(column, member)
+        self._directory.cleanup()
+
+    def abort(self) -> None:
+        # The archive is only created in `close`, so there are just the temporary column files to remove
+        for _, file in self._columns.values():
+            file.close()
+        self._directory.cleanup()
+
+
+def get_npy_header(descriptor: str, length: int) -> bytes:
+    # Version 1.0 of the .npy format, the header is padded so that the data is aligned to 64 bytes
+    header = f"{{'descr': '{descriptor}', 'fortran_order': False, 'shape': ({length},), }}"
+    prefix_length = 10
+    header += " " * (-(prefix_length + len(header) + 1) % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, byteorder="little") + header.encode("latin1")
+
+
+class ArrowExporter(TraceExporter):
+    """
+    Writes entries and memory accesses as two tables, in Parquet or Arrow IPC files, with a row group per `RowGroup`.
+
+    ISA modes are indices of triples and models, which are stored in the schema's metadata.
+    """
+    def __init__(self, path: str, trace_data: TraceData, file_format: str):
+        super().__init__(path, trace_data)
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Exporting to Parquet and Arrow requires the 'pyarrow' package")
+        from execution_tracer.execution_tracer_reader import MemoryAccessType
+
+        self._pa = pyarrow
+        self._access_types = pyarrow.array([access_type.name for access_type in MemoryAccessType], pyarrow.string())
+        metadata = {"triple_and_models": ";".join(trace_data.triple_and_models)}
+        self._entry_schema = pyarrow.schema([
+            ("entry", pyarrow.uint64()),
+            ("pc", pyarrow.uint64()),
+            ("opcode", pyarrow.binary()),
+            ("isa_mode", pyarrow.uint8()),
+        ], metadata=metadata)
+        self._memory_access_schema = pyarrow.schema([
+            ("entry", pyarrow.uint64()),
+            ("type", pyarrow.dictionary(pyarrow.uint8(), pyarrow.string())),
+            ("address", pyarrow.uint64()),
+            ("value", pyarrow.uint64()),
+            ("address_physical", pyarrow.uint64()),
+        ], metadata=metadata)
+
+        if file_format == "parquet":
+            open_writer = pyarrow.parquet.ParquetWriter
+        else:
+            open_writer = pyarrow.ipc.new_file
+        self._entry_writer = open_writer(path, self._entry_schema)
+        self._memory_access_writer = open_writer(get_memory_access_path(path), self._memory_access_schema)
+
+    def _column(self, column: array, data_type):
+        return self._pa.Array.from_buffers(data_type, len(column), [None, self._pa.py_buffer(column)])
+
+    def write_row_group(self, row_group: RowGroup) -> None:
+        pa = self._pa
+        opcode_offsets = array("i", [0, *row_group.opcode_end])
+        opcode = pa.Array.from_buffers(pa.binary(), len(row_group), [None, pa.py_buffer(opcode_offsets), pa.py_buffer(row_group.opcode)])
+        self._entry_writer.write_table(pa.Table.from_arrays([
+            self._column(row_group.entry, pa.uint64()),
+            self._column(row_group.pc, pa.uint64()),
+            opcode,
+            self._column(row_group.isa_mode, pa.uint8()),
+        ], schema=self._entry_schema))
+        self._memory_access_writer.write_table(pa.Table.from_arrays([
+            self._column(row_group.memory_entry, pa.uint64()),
+            pa.DictionaryArray.from_arrays(self._column(row_group.memory_type, pa.uint8()), self._access_types),
+            self._column(row_group.memory_address, pa.uint64()),
+            self._column(row_group.memory_value, pa.uint64()),
+            self._column(row_group.memory_address_physical, pa.uint64()),
+        ], schema=self._memory_access_schema))
+
+    def close(self) -> None:
+        self._entry_writer.close()
+        self._memory_access_writer.close()
+
+    def abort(self) -> None:
+        self.close()
+        for path in (self.path, get_memory_access_path(self.path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def export_trace(trace_data: TraceData, path: str, file_format: Optional[str] = None, row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> int:
+    # Returns the number of exported entries
+    from execution_tracer.execution_tracer_reader import DEFAULT_CHUNK_SIZE
+
+    if file_format is None:
+        file_format = get_export_format(path)
+    if file_format == "npz":
+        exporter: TraceExporter = NpzExporter(path, trace_data)
+    else:
+        exporter = ArrowExporter(path, trace_data, file_format)
+
+    entry_count = 0
+    try:
+        row_group = RowGroup()
+        # Chunks aren't longer than row groups, so row groups end up less than twice as long as requested
+        for chunk in trace_data.iter_chunks(size=min(row_group_size, DEFAULT_CHUNK_SIZE)):
+            row_group.append_chunk(trace_data, chunk)
+            if len(row_group) >= row_group_size:
+                exporter.write_row_group(row_group)
+                entry_count += len(row_group)
+                row_group = RowGroup()
+        if len(row_group) > 0 or entry_count == 0:
+            exporter.write_row_group(row_group)
+            entry_count += len(row_group)
+    except BaseException:
+        exporter.abort()
+        raise
+    exporter.close()
+    return entry_count
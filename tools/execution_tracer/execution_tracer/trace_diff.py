@@ -0,0 +1,164 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from execution_tracer.execution_tracer_reader import TraceChunk, TraceData, TraceEntry
+
+# Number of entries compared at once, as long as windows are equal the entries aren't compared one by one
+DEFAULT_DIFF_WINDOW = 1024
+DEFAULT_DIFF_CONTEXT = 5
+
+
+class TraceCursor:
+    # Position in a trace, which is being decoded chunk by chunk
+    def __init__(self, trace_data: TraceData):
+        self.trace_data = trace_data
+        self._chunks = trace_data.iter_chunks()
+        self.previous_chunk: Optional[TraceChunk] = None
+        self.chunk: Optional[TraceChunk] = None
+        self.index = 0
+
+    @property
+    def entry_index(self) -> int:
+        return self.index if self.chunk is None else self.chunk.start_index + self.index
+
+    def remaining(self) -> int:
+        # Number of entries left in the current chunk, moves to the next chunk if the current one is done
+        while self.chunk is None or self.index == len(self.chunk):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            if self.chunk is not None:
+                self.previous_chunk = self.chunk
+            self.chunk = chunk
+            self.index = 0
+        return len(self.chunk) - self.index
+
+    def get_context(self, before: int, after: int) -> list[tuple[int, TraceEntry]]:
+        # Entries around the current one, decoding further chunks if necessary
+        trace_data = self.trace_data
+        context = []
+        if self.chunk is None:
+            return context
+        if self.previous_chunk is not None and before > self.index:
+            previous = self.previous_chunk
+            for i in range(max(len(previous) - (before - self.index), 0), len(previous)):
+                context.append((previous.start_index + i, trace_data.get_chunk_entry(previous, i)))
+        chunk = self.chunk
+        for i in range(max(self.index - before, 0), min(self.index + after + 1, len(chunk))):
+            context.append((chunk.start_index + i, trace_data.get_chunk_entry(chunk, i)))
+        missing = self.index + after + 1 - len(chunk)
+        while missing > 0:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            for i in range(min(missing, len(chunk))):
+                context.append((chunk.start_index + i, trace_data.get_chunk_entry(chunk, i)))
+            missing -= len(chunk)
+        return context
+
+
+class Divergence(NamedTuple):
+    entry_index: int
+    # PCs of the first divergent entries, None if the trace has already ended
+    first_pc: Optional[int]
+    second_pc: Optional[int]
+
+
+@dataclass
+class TraceDiff:
+    first: TraceCursor
+    second: TraceCursor
+    divergence: Optional[Divergence] = None
+    entry_count: int = 0
+
+
+def _compare_windows(first: TraceCursor, second: TraceCursor, length: int) -> int:
+    # Returns the number of leading entries that are equal in both windows
+    first_data, second_data = first.trace_data, second.trace_data
+    first_chunk, second_chunk = first.chunk, second.chunk
+    i, j = first.index, second.index
+    if first_chunk.isa_mode[i:i + length] == second_chunk.isa_mode[j:j + length] and \
+            first_data.get_chunk_data(first_chunk, i, i + length) == second_data.get_chunk_data(second_chunk, j, j + length):
+        return length
+    # Windows can also differ only in block headers, if the traces were split into blocks differently
+    for k in range(length):
+        if first_chunk.isa_mode[i + k] != second_chunk.isa_mode[j + k] or \
+                first_data.get_chunk_data(first_chunk, i + k, i + k + 1) != second_data.get_chunk_data(second_chunk, j + k, j + k + 1):
+            return k
+    return length
+
+
+def diff_traces(first_data: TraceData, second_data: TraceData, window: int = DEFAULT_DIFF_WINDOW) -> TraceDiff:
+    """
+    Find the first entry that differs between the traces, comparing raw data of the entries.
+
+    Windows of entries are compared at once, without decoding additional data of the entries or formatting them.
+    """
+    if (first_data.pc_length, first_data.has_opcodes, first_data.triple_and_models) != \
+            (second_data.pc_length, second_data.has_opcodes, second_data.triple_and_models):
+        raise ValueError("Traces with different headers can't be compared")
+
+    first = TraceCursor(first_data)
+    second = TraceCursor(second_data)
+    diff = TraceDiff(first, second)
+    while True:
+        first_remaining = first.remaining()
+        second_remaining = second.remaining()
+        if first_remaining == 0 or second_remaining == 0:
+            if first_remaining != second_remaining:
+                diff.divergence = Divergence(
+                    first.entry_index,
+                    first.chunk.pc[first.index] if first_remaining else None,
+                    second.chunk.pc[second.index] if second_remaining else None,
+                )
+            diff.entry_count = first.entry_index
+            return diff
+
+        length = min(window, first_remaining, second_remaining)
+        equal = _compare_windows(first, second, length)
+        first.index += equal
+        second.index += equal
+        if equal < length:
+            diff.divergence = Divergence(first.entry_index, first.chunk.pc[first.index], second.chunk.pc[second.index])
+            diff.entry_count = first.entry_index
+            return diff
+
+
+def format_context(trace_data: TraceData, context: list[tuple[int, TraceEntry]], marked_index: int) -> str:
+    lines = []
+    for entry_index, entry in context:
+        marker = ">" if entry_index == marked_index else " "
+        entry_lines = trace_data.format_entry(entry).split("\n")
+        lines.append(f"{marker} {entry_index:>10}: {entry_lines[0]}")
+        lines.extend(f"  {'':>10}  {line}" for line in entry_lines[1:])
+    return "\n".join(lines)
+
+
+def format_diff(diff: TraceDiff, context: int = DEFAULT_DIFF_CONTEXT) -> str:
+    first_name = diff.first.trace_data.file.name
+    second_name = diff.second.trace_data.file.name
+    divergence = diff.divergence
+    if divergence is None:
+        return f"Traces are identical, {diff.entry_count} entries compared"
+
+    def format_pc(pc: Optional[int]) -> str:
+        return "trace ended" if pc is None else f"PC 0x{pc:X}"
+
+    lines = [
+        f"Traces differ at entry {divergence.entry_index}",
+        f"  {first_name}: {format_pc(divergence.first_pc)}",
+        f"  {second_name}: {format_pc(divergence.second_pc)}",
+    ]
+    for name, cursor in ((first_name, diff.first), (second_name, diff.second)):
+        lines.append(f"Context of {name}:")
+        lines.append(format_context(cursor.trace_data, cursor.get_context(context, context), divergence.entry_index))
+    return "\n".join(lines)
@@ -0,0 +1,182 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import BinaryIO, TextIO
+
+from execution_tracer.execution_tracer_reader import (
+    BYTE_ORDER, FILE_SIGNATURE, FILE_VERSION, AdditionalDataType, MemoryAccessType, RiscVAtomicInstruction,
+    RiscVAtomicInstructionWidth,
+)
+
+# Size of data written to the trace file at once
+WRITE_BUFFER_SIZE = 1024 * 1024
+MAX_BLOCK_LENGTH = 64
+
+# Real instructions of each architecture, so that generated traces can be disassembled.
+# Thumb instructions are stored in the same order as in traces produced by Renode
+OPCODES = {
+    "riscv": [
+        bytes.fromhex("13000000"),  # nop
+        bytes.fromhex("93003100"),  # addi x1, x2, 3
+        bytes.fromhex("b7050300"),  # lui a1, 48
+        bytes.fromhex("2320b500"),  # sw a1, 0(a0)
+        bytes.fromhex("0100"),      # c.nop
+        bytes.fromhex("0545"),      # c.li a0, 1
+    ],
+    "arm": [
+        bytes.fromhex("0100a0e3"),  # mov r0, #1
+        bytes.fromhex("011080e0"),  # add r1, r0, r1
+        bytes.fromhex("00f020e3"),  # nop
+        bytes.fromhex("000091e5"),  # ldr r0, [r1]
+        bytes.fromhex("000081e5"),  # str r0, [r1]
+    ],
+    "thumb": [
+        bytes.fromhex("0020"),      # movs r0, #0
+        bytes.fromhex("8842"),      # cmp r0, r1
+        bytes.fromhex("00bf"),      # nop
+        bytes.fromhex("4ff00100"),  # mov.w r0, #1
+    ],
+}
+REGISTERS = ("x1", "x2", "sp", "pc")
+
+
+def get_opcodes(triple_and_model: str) -> list[bytes]:
+    triple = triple_and_model.split(" ")[0]
+    for architecture, opcodes in OPCODES.items():
+        if triple.startswith(architecture):
+            return opcodes
+    raise ValueError(f"No opcodes to generate for {triple_and_model}, supported architectures: {', '.join(OPCODES)}")
+
+
+@dataclass
+class TraceGeneratorConfig:
+    entry_count: int = 100 * 1000
+    # 0 to generate entries without PCs
+    pc_length: int = 4
+    has_opcodes: bool = True
+    # Blocks of entries of different ISAs are generated if there are multiple triples
+    triple_and_models: tuple[str, ...] = ("riscv32 rv32imac",)
+    additional_data_types: tuple[AdditionalDataType, ...] = ()
+    # Chance of each entry to have additional data, of one of the `additional_data_types`
+    additional_data_probability: float = 0.25
+    code_address: int = 0x1000
+    code_size: int = 0x4000
+    data_address: int = 0x80000000
+    data_size: int = 0x10000
+    # Chance of jumping to a random address after each instruction
+    branch_probability: float = 0.1
+    seed: int = 0
+
+
+class TraceGenerator:
+    """
+    Generates synthetic ReTrace files, e.g. to measure performance of the reader.
+
+    PCs walk through the code region, jumping to random places of it every few instructions, so that
+    PCs repeat like in real programs. The opcode at each PC is always the same.
+    """
+    def __init__(self, config: TraceGeneratorConfig):
+        if config.pc_length == 0 and not config.has_opcodes:
+            raise ValueError("Entries have to contain PCs or opcodes")
+        if config.has_opcodes and not config.triple_and_models:
+            raise ValueError("Traces with opcodes require at least one triple and model")
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._opcodes = [get_opcodes(triple_and_model) for triple_and_model in config.triple_and_models] if config.has_opcodes else [[b""]]
+        self._pc_mask = (1 << (8 * config.pc_length)) - 1
+        self._pc = config.code_address
+
+    def header(self) -> bytes:
+        header = FILE_SIGNATURE + FILE_VERSION + bytes([self.config.pc_length, self.config.has_opcodes])
+        if self.config.has_opcodes:
+            header += bytes([len(self.config.triple_and_models)])
+            for triple_and_model in self.config.triple_and_models:
+                header += bytes([len(triple_and_model)]) + triple_and_model.encode()
+        return header
+
+    def _next_pc(self, opcode_length: int) -> int:
+        config = self.config
+        if self._random.random() < config.branch_probability:
+            pc = config.code_address + self._random.randrange(0, config.code_size, 4)
+        else:
+            pc = self._pc + max(opcode_length, 4 if not config.has_opcodes else 0)
+            if pc >= config.code_address + config.code_size:
+                pc = config.code_address
+        self._pc = pc
+        return pc
+
+    def _entry(self, isa_mode: int) -> bytes:
+        config = self.config
+        pc = self._pc
+        opcodes = self._opcodes[isa_mode]
+        opcode = opcodes[(pc >> 1) % len(opcodes)]
+        entry = (pc & self._pc_mask).to_bytes(config.pc_length, byteorder=BYTE_ORDER)
+        if config.has_opcodes:
+            entry += bytes([len(opcode)]) + opcode
+        if config.additional_data_types and self._random.random() < config.additional_data_probability:
+            entry += self._additional_data(self._random.choice(config.additional_data_types))
+        self._next_pc(len(opcode))
+        return entry + bytes([AdditionalDataType.Empty.value])
+
+    def _additional_data(self, additional_data_type: AdditionalDataType) -> bytes:
+        config = self.config
+        rnd = self._random
+        data = bytes([additional_data_type.value])
+        if additional_data_type is AdditionalDataType.MemoryAccess:
+            access_type = rnd.choice((MemoryAccessType.MemoryRead, MemoryAccessType.MemoryWrite, MemoryAccessType.MemoryIORead))
+            address = config.data_address + rnd.randrange(0, config.data_size, 4)
+            data += bytes([access_type.value])
+            data += address.to_bytes(8, byteorder=BYTE_ORDER)
+            data += rnd.getrandbits(32).to_bytes(8, byteorder=BYTE_ORDER)
+            data += address.to_bytes(8, byteorder=BYTE_ORDER)
+        elif additional_data_type is AdditionalDataType.RiscVVectorConfiguration:
+            data += rnd.randrange(1, 256).to_bytes(8, byteorder=BYTE_ORDER) + rnd.randrange(256).to_bytes(8, byteorder=BYTE_ORDER)
+        elif additional_data_type is AdditionalDataType.RiscVAtomicInstruction:
+            width = rnd.choice((RiscVAtomicInstructionWidth.Word, RiscVAtomicInstructionWidth.DoubleWord))
+            word_size = 4 if width is RiscVAtomicInstructionWidth.Word else 8
+            data += bytes([rnd.randrange(2), width.value, rnd.choice(list(RiscVAtomicInstruction)).value])
+            data += b"".join(rnd.getrandbits(8 * word_size).to_bytes(word_size, byteorder=BYTE_ORDER) for _ in range(4))
+        elif additional_data_type is AdditionalDataType.Registers:
+            data += bytes([rnd.randrange(2), len(REGISTERS)])
+            for name in REGISTERS:
+                data += bytes([len(name)]) + name.encode() + bytes([4]) + rnd.getrandbits(32).to_bytes(4, byteorder=BYTE_ORDER)
+        else:
+            raise ValueError(f"Can't generate additional data of type {additional_data_type}")
+        return data
+
+    def write(self, stream: BinaryIO) -> None:
+        config = self.config
+        multiple_triple_and_models = len(config.triple_and_models) > 1 and config.has_opcodes
+        buffer = bytearray(self.header())
+        written = 0
+        while written < config.entry_count:
+            isa_mode = 0
+            block_length = config.entry_count - written
+            if multiple_triple_and_models:
+                isa_mode = self._random.randrange(len(config.triple_and_models))
+                block_length = min(self._random.randint(1, MAX_BLOCK_LENGTH), block_length)
+                buffer += bytes([isa_mode]) + block_length.to_bytes(8, byteorder=BYTE_ORDER)
+            for _ in range(block_length):
+                buffer += self._entry(isa_mode)
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    stream.write(buffer)
+                    buffer.clear()
+            written += block_length
+        stream.write(buffer)
+
+
+def generate_trace(stream: BinaryIO, config: TraceGeneratorConfig) -> None:
+    TraceGenerator(config).write(stream)
+
+
+def generate_pc2line(stream: TextIO, config: TraceGeneratorConfig, source_path: str, line_count: int) -> None:
+    # Every 2-byte aligned address of the code region is mapped to a line, a line covers 16 bytes of code
+    for offset in range(0, config.code_size, 2):
+        stream.write(f"{config.code_address + offset:x} {source_path}:{1 + (offset // 16) % line_count}\n")
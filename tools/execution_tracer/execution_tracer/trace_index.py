@@ -0,0 +1,223 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import bisect
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, BinaryIO, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from execution_tracer.execution_tracer_reader import TraceData
+
+INDEX_SIGNATURE = b"ReTraceIdx"
+INDEX_VERSION = 1
+INDEX_EXTENSION = ".retrace.idx"
+# Trace size, trace modification time, checkpoint interval, number of entries, number of checkpoints, number of blocks
+INDEX_HEADER = struct.Struct("<QQQQQQ")
+DEFAULT_INDEX_INTERVAL = 64 * 1024
+
+
+class Checkpoint(NamedTuple):
+    entry_index: int
+    # Offset in the (uncompressed) trace file
+    offset: int
+    isa_mode: int
+    instructions_left_in_block: int
+
+
+@dataclass
+class TraceIndex:
+    """
+    Sidecar index of a trace file, allowing to start decoding at an arbitrary entry.
+
+    Checkpoints are stored every `interval` entries, together with the lowest and the highest PC of entries
+    between the checkpoint and the next one. For traces with multiple ISAs, starts of all blocks are stored too,
+    as decoding can be resumed at any block header.
+    For compressed traces offsets refer to the decompressed data.
+    """
+    trace_size: int
+    trace_mtime: int
+    interval: int
+    entry_count: int = 0
+    checkpoint_entry: array = field(default_factory=lambda: array("Q"))
+    checkpoint_offset: array = field(default_factory=lambda: array("Q"))
+    checkpoint_isa_mode: array = field(default_factory=lambda: array("B"))
+    checkpoint_instructions_left: array = field(default_factory=lambda: array("Q"))
+    checkpoint_pc_low: array = field(default_factory=lambda: array("Q"))
+    checkpoint_pc_high: array = field(default_factory=lambda: array("Q"))
+    block_entry: array = field(default_factory=lambda: array("Q"))
+    block_offset: array = field(default_factory=lambda: array("Q"))
+
+    def _columns(self) -> tuple[array, ...]:
+        return (
+            self.checkpoint_entry, self.checkpoint_offset, self.checkpoint_isa_mode, self.checkpoint_instructions_left,
+            self.checkpoint_pc_low, self.checkpoint_pc_high, self.block_entry, self.block_offset,
+        )
+
+    def find_checkpoint(self, index: int) -> Optional[Checkpoint]:
+        # The closest place before the entry number `index`, from which decoding can be started
+        i = bisect.bisect_right(self.checkpoint_entry, index) - 1
+        if i < 0:
+            return None
+        checkpoint = Checkpoint(
+            self.checkpoint_entry[i], self.checkpoint_offset[i],
+            self.checkpoint_isa_mode[i], self.checkpoint_instructions_left[i],
+        )
+        j = bisect.bisect_right(self.block_entry, index) - 1
+        if j >= 0 and self.block_entry[j] > checkpoint.entry_index:
+            # The block header is read again, so the ISA and the number of instructions left don't matter
+            checkpoint = Checkpoint(self.block_entry[j], self.block_offset[j], 0, 0)
+        return checkpoint
+
+    def find_pc_range(self, low: int, high: int, start: int = 0, count: Optional[int] = None) -> list[tuple[int, int]]:
+        # Returns ranges of entries, as (start, count) pairs, that can contain PCs in [low, high)
+        end = self.entry_count if count is None else min(start + count, self.entry_count)
+        ranges: list[tuple[int, int]] = []
+        for i in range(len(self.checkpoint_entry)):
+            if self.checkpoint_pc_high[i] < low or self.checkpoint_pc_low[i] >= high:
+                continue
+            region_start = max(self.checkpoint_entry[i], start)
+            region_end = min(self.checkpoint_entry[i + 1] if i + 1 < len(self.checkpoint_entry) else self.entry_count, end)
+            if region_start >= region_end:
+                continue
+            if ranges and sum(ranges[-1]) == region_start:
+                ranges[-1] = (ranges[-1][0], region_end - ranges[-1][0])
+            else:
+                ranges.append((region_start, region_end - region_start))
+        return ranges
+
+    def is_up_to_date(self, trace_path: str) -> bool:
+        stat = os.stat(trace_path)
+        return stat.st_size == self.trace_size and stat.st_mtime_ns == self.trace_mtime
+
+    def save(self, file: BinaryIO) -> None:
+        file.write(INDEX_SIGNATURE)
+        file.write(bytes([INDEX_VERSION]))
+        file.write(INDEX_HEADER.pack(
+            self.trace_size, self.trace_mtime, self.interval, self.entry_count,
+            len(self.checkpoint_entry), len(self.block_entry),
+        ))
+        for column in self._columns():
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            column.tofile(file)
+
+    @classmethod
+    def load(cls, file: BinaryIO) -> TraceIndex:
+        if file.read(len(INDEX_SIGNATURE)) != INDEX_SIGNATURE:
+            raise ValueError("Index signature isn't detected")
+        version = file.read(1)
+        if version != bytes([INDEX_VERSION]):
+            raise ValueError(f"Unsupported index version {version}, expected {INDEX_VERSION}")
+        header = file.read(INDEX_HEADER.size)
+        if len(header) != INDEX_HEADER.size:
+            raise ValueError("Invalid index header")
+        trace_size, trace_mtime, interval, entry_count, checkpoint_count, block_count = INDEX_HEADER.unpack(header)
+
+        index = cls(trace_size, trace_mtime, interval, entry_count)
+        columns = index._columns()
+        try:
+            for column in columns[:6]:
+                column.fromfile(file, checkpoint_count)
+            for column in columns[6:]:
+                column.fromfile(file, block_count)
+        except EOFError:
+            raise ValueError("Unexpected end of index file")
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+        return index
+
+
+def get_index_path(trace_path: str) -> str:
+    return trace_path + INDEX_EXTENSION
+
+
+def load_index(trace_path: str) -> Optional[TraceIndex]:
+    # Returns the sidecar index of the trace, if there is one and it matches the trace
+    index_path = get_index_path(trace_path)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, "rb") as file:
+        index = TraceIndex.load(file)
+    if not index.is_up_to_date(trace_path):
+        print(f"Index {index_path} is outdated, ignoring it. Rebuild it with the 'index' subcommand", file=sys.stderr)
+        return None
+    return index
+
+
+def build_index(trace_data: 'TraceData', trace_path: str, interval: int = DEFAULT_INDEX_INTERVAL) -> TraceIndex:
+    # Imported here, as the reader imports this module
+    from execution_tracer.execution_tracer_reader import BLOCK_HEADER_LENGTH
+
+    stat = os.stat(trace_path)
+    index = TraceIndex(stat.st_size, stat.st_mtime_ns, interval)
+    # The block the currently processed entry belongs to, as its first entry and length
+    block_start = 0
+    block_length = 0
+
+    for chunk in trace_data.iter_chunks():
+        chunk_start = chunk.start_index
+        for start in chunk.block_start:
+            index.block_entry.append(chunk_start + start)
+            index.block_offset.append(chunk.get_file_offset(start) - BLOCK_HEADER_LENGTH)
+
+        # Checkpoints of the chunk are entries with numbers divisible by the interval
+        first = -(-chunk_start // interval) * interval
+        for entry in range(first, chunk_start + len(chunk), interval):
+            i = entry - chunk_start
+            block = bisect.bisect_right(chunk.block_start, i) - 1
+            if block >= 0:
+                block_start = chunk_start + chunk.block_start[block]
+                block_length = chunk.block_length[block]
+            if trace_data.multiple_triple_and_models and entry == block_start:
+                # Resume from the block header
+                index.checkpoint_offset.append(chunk.get_file_offset(i) - BLOCK_HEADER_LENGTH)
+                index.checkpoint_instructions_left.append(0)
+            else:
+                index.checkpoint_offset.append(chunk.get_file_offset(i))
+                index.checkpoint_instructions_left.append(block_start + block_length - entry if trace_data.multiple_triple_and_models else 0)
+            index.checkpoint_entry.append(entry)
+            index.checkpoint_isa_mode.append(chunk.isa_mode[i])
+            index.checkpoint_pc_low.append(chunk.pc[i])
+            index.checkpoint_pc_high.append(chunk.pc[i])
+        if chunk.block_start:
+            block_start = chunk_start + chunk.block_start[-1]
+            block_length = chunk.block_length[-1]
+
+        # Update PC summaries of checkpoints overlapping with the chunk
+        i = len(index.checkpoint_entry) - 1
+        end = len(chunk)
+        while end > 0:
+            begin = max(index.checkpoint_entry[i] - chunk_start, 0)
+            pcs = chunk.pc[begin:end]
+            index.checkpoint_pc_low[i] = min(index.checkpoint_pc_low[i], min(pcs))
+            index.checkpoint_pc_high[i] = max(index.checkpoint_pc_high[i], max(pcs))
+            end = begin
+            i -= 1
+
+        index.entry_count = chunk_start + len(chunk)
+    return index
+
+
+def create_fixed_length_index(trace_path: str, data_offset: int, entry_length: int, interval: int) -> TraceIndex:
+    # Index of a trace, which is assumed to only contain entries of the same length; it's not verified here
+    stat = os.stat(trace_path)
+    index = TraceIndex(stat.st_size, stat.st_mtime_ns, interval, (stat.st_size - data_offset) // entry_length)
+    for entry in range(0, index.entry_count, interval):
+        index.checkpoint_entry.append(entry)
+        index.checkpoint_offset.append(data_offset + entry * entry_length)
+        index.checkpoint_isa_mode.append(0)
+        index.checkpoint_instructions_left.append(0)
+        index.checkpoint_pc_low.append(0)
+        index.checkpoint_pc_high.append(2 ** 64 - 1)
+    return index
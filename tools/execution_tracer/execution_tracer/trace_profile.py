@@ -0,0 +1,214 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+import bisect
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, BinaryIO, TextIO
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
+
+if TYPE_CHECKING:
+    from execution_tracer.execution_tracer_reader import TraceChunk, TraceData
+
+UNKNOWN_FUNCTION = -1
+UNKNOWN_FUNCTION_NAME = "[unknown]"
+# Without opcodes, PCs further apart than the longest instruction are treated as a jump
+MAX_INSTRUCTION_LENGTH = 4
+# Inferred stacks are cut at this depth, e.g. if returns of a deep recursion weren't recognized
+MAX_STACK_DEPTH = 512
+DEFAULT_PROFILE_TOP_COUNT = 20
+
+
+class SymbolIndex:
+    """
+    Function symbols of an ELF file, as sorted and non-overlapping address ranges.
+
+    Symbols without a size extend to the next symbol or to the end of their section.
+    """
+    def __init__(self, elf_file: BinaryIO):
+        elf = ELFFile(elf_file)
+        # Function symbols by their address, aliases are resolved to the first global symbol
+        symbols: dict[int, tuple[str, int, int]] = {}
+        for section in elf.iter_sections():
+            if not isinstance(section, SymbolTableSection):
+                continue
+            for symbol in section.iter_symbols():
+                if symbol["st_info"]["type"] != "STT_FUNC" or not symbol.name or not isinstance(symbol["st_shndx"], int):
+                    continue
+                address = symbol["st_value"]
+                if elf["e_machine"] == "EM_ARM":
+                    # The lowest bit marks Thumb functions
+                    address &= ~1
+                symbol_section = elf.get_section(symbol["st_shndx"])
+                end = address + symbol["st_size"] if symbol["st_size"] else symbol_section["sh_addr"] + symbol_section["sh_size"]
+                is_global = symbol["st_info"]["bind"] == "STB_GLOBAL"
+                if address not in symbols or (is_global and not symbols[address][2]):
+                    symbols[address] = (symbol.name, end, is_global)
+
+        self.start = array("Q")
+        self.end = array("Q")
+        self.names: list[str] = []
+        addresses = sorted(symbols)
+        for i, address in enumerate(addresses):
+            name, end, _ = symbols[address]
+            if i + 1 < len(addresses):
+                end = min(end, addresses[i + 1])
+            if end <= address:
+                continue
+            self.start.append(address)
+            self.end.append(end)
+            self.names.append(name)
+        if not self.names:
+            raise ValueError(f"The file ({elf_file.name}) doesn't contain function symbols")
+
+    def find_function(self, pc: int) -> int:
+        # Returns the index of the function containing the PC or `UNKNOWN_FUNCTION`
+        i = bisect.bisect_right(self.start, pc) - 1
+        if i >= 0 and pc < self.end[i]:
+            return i
+        return UNKNOWN_FUNCTION
+
+    def get_name(self, function: int) -> str:
+        return UNKNOWN_FUNCTION_NAME if function == UNKNOWN_FUNCTION else self.names[function]
+
+
+@dataclass
+class Profile:
+    symbols: SymbolIndex
+    entry_count: int = 0
+    pc_counts: Counter[int] = field(default_factory=Counter)
+    # Number of instructions executed with each inferred stack of functions, from the outermost one
+    stack_counts: Counter[tuple[int, ...]] = field(default_factory=Counter)
+
+    def get_function_counts(self) -> Counter[int]:
+        # Instructions executed in each function, not including functions it called
+        function_counts: Counter[int] = Counter()
+        for pc, count in self.pc_counts.items():
+            function_counts[self.symbols.find_function(pc)] += count
+        return function_counts
+
+    def format(self, top_count: int = DEFAULT_PROFILE_TOP_COUNT) -> str:
+        lines = [f"Entries: {self.entry_count}", f"{'Instructions':>14} {'Percent':>8}  Function"]
+        for function, count in self.get_function_counts().most_common(top_count):
+            percentage = 100 * count / self.entry_count if self.entry_count else 0
+            lines.append(f"{count:>14} {percentage:>7.2f}%  {self.symbols.get_name(function)}")
+        return "\n".join(lines)
+
+    def write_folded_stacks(self, stream: TextIO) -> None:
+        # The format of flamegraph.pl and compatible tools: names of functions separated with semicolons and the count
+        for stack, count in sorted(self.stack_counts.items()):
+            stream.write(";".join(self.symbols.get_name(function) for function in stack))
+            stream.write(f" {count}\n")
+
+
+class Profiler:
+    """
+    Infers calls and returns from discontinuities of PCs, while counting executed instructions.
+
+    A jump to the start of a function is a call. A jump right after the instruction that called one of the functions
+    on the stack is a return from it. A jump to a function that's already on the stack, e.g. a return from
+    an interrupt, also returns to it. Any other jump to a different function replaces the current one, like a tail call.
+    """
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self._function_cache: dict[int, int] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        # Functions on the stack, with ranges of addresses they return to
+        self._stack: list[int] = []
+        self._return_low: list[int] = []
+        self._return_high: list[int] = []
+        self._stack_key: tuple[int, ...] = ()
+        self._run_length = 0
+        self._previous_pc = None
+        self._previous_length = 0
+
+    def _flush_run(self) -> None:
+        if self._run_length:
+            self.profile.stack_counts[self._stack_key] += self._run_length
+            self._run_length = 0
+
+    def _get_functions(self, pcs: array) -> list[int]:
+        cache = self._function_cache
+        find_function = self.profile.symbols.find_function
+        functions = []
+        for pc in pcs:
+            function = cache.get(pc)
+            if function is None:
+                function = cache[pc] = find_function(pc)
+            functions.append(function)
+        return functions
+
+    def update(self, trace_data: TraceData, chunk: TraceChunk) -> None:
+        profile = self.profile
+        profile.entry_count += len(chunk)
+        profile.pc_counts.update(chunk.pc)
+
+        starts = profile.symbols.start
+        stack = self._stack
+        return_low = self._return_low
+        return_high = self._return_high
+        has_opcodes = trace_data.has_opcodes
+        previous_pc = self._previous_pc
+        previous_length = self._previous_length
+        for i, (pc, function) in enumerate(zip(chunk.pc, self._get_functions(chunk.pc))):
+            if previous_pc is None:
+                changed = True
+                stack.append(function)
+                return_low.append(0)
+                return_high.append(0)
+            elif (pc != previous_pc + previous_length) if has_opcodes else not (0 < pc - previous_pc <= MAX_INSTRUCTION_LENGTH):
+                changed = True
+                if function != UNKNOWN_FUNCTION and pc == starts[function]:
+                    if len(stack) == MAX_STACK_DEPTH:
+                        del stack[0], return_low[0], return_high[0]
+                    stack.append(function)
+                    if has_opcodes:
+                        return_low.append(previous_pc + previous_length)
+                        return_high.append(previous_pc + previous_length)
+                    else:
+                        return_low.append(previous_pc + 1)
+                        return_high.append(previous_pc + MAX_INSTRUCTION_LENGTH)
+                else:
+                    for depth in range(len(stack) - 1, 0, -1):
+                        if return_low[depth] <= pc <= return_high[depth]:
+                            del stack[depth:], return_low[depth:], return_high[depth:]
+                            break
+                    else:
+                        # A branch within the function on top of the stack, e.g. a recursive one, doesn't unwind to its outer call
+                        if stack[-1] != function:
+                            for depth in range(len(stack) - 2, -1, -1):
+                                if stack[depth] == function:
+                                    del stack[depth + 1:], return_low[depth + 1:], return_high[depth + 1:]
+                                    break
+                    stack[-1] = function
+            else:
+                changed = stack[-1] != function
+                stack[-1] = function
+
+            if changed:
+                stack_key = tuple(stack)
+                if stack_key != self._stack_key:
+                    self._flush_run()
+                    self._stack_key = stack_key
+            self._run_length += 1
+            previous_pc = pc
+            previous_length = chunk.opcode_length[i] if has_opcodes else 0
+        self._previous_pc = previous_pc
+        self._previous_length = previous_length
+
+    def profile_trace(self, trace_data: TraceData) -> None:
+        # Traces are independent, so stacks inferred from one don't carry over to the next one
+        self._reset()
+        for chunk in trace_data.iter_chunks():
+            self.update(trace_data, chunk)
+        self._flush_run()
@@ -0,0 +1,129 @@
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    from execution_tracer.execution_tracer_reader import MemoryAccessType, TraceChunk, TraceData
+
+DEFAULT_PAGE_SIZE = 4096
+DEFAULT_TOP_COUNT = 10
+
+
+@dataclass
+class TraceStatistics:
+    """
+    Statistics of a trace, or of a range of its entries, collected in a single pass over its chunks.
+
+    Memory usage depends on the number of unique PCs and memory pages, not on the length of the trace.
+    Statistics of consecutive ranges can be merged, e.g. when they are collected in parallel.
+    """
+    page_size: int = DEFAULT_PAGE_SIZE
+    entry_count: int = 0
+    pc_counts: Counter[int] = field(default_factory=Counter)
+    # Histogram of opcode lengths, in bytes
+    instruction_length_counts: Counter[int] = field(default_factory=Counter)
+    # Counts of switches between pairs of ISA modes
+    isa_switch_counts: Counter[tuple[int, int]] = field(default_factory=Counter)
+    # Counts of memory accesses, by page number and access type
+    memory_access_counts: Counter[tuple[int, MemoryAccessType]] = field(default_factory=Counter)
+    # ISA modes of the first and the last entry, required to count switches between merged ranges
+    first_isa_mode: Optional[int] = None
+    last_isa_mode: Optional[int] = None
+
+    def update(self, trace_data: TraceData, chunk: TraceChunk) -> None:
+        if len(chunk) == 0:
+            return
+        self.entry_count += len(chunk)
+        # Counting array columns is done by `Counter` in C, without creating an object per entry
+        if trace_data.has_pc:
+            self.pc_counts.update(chunk.pc)
+        if trace_data.has_opcodes:
+            self.instruction_length_counts.update(chunk.opcode_length)
+
+        isa_mode = chunk.isa_mode
+        if self.first_isa_mode is None:
+            self.first_isa_mode = isa_mode[0]
+        # ISA mode can change only at the start of a block
+        for start in chunk.block_start:
+            previous = isa_mode[start - 1] if start > 0 else self.last_isa_mode
+            if previous is not None and previous != isa_mode[start]:
+                self.isa_switch_counts[previous, isa_mode[start]] += 1
+        self.last_isa_mode = isa_mode[-1]
+
+        page_size = self.page_size
+        self.memory_access_counts.update(
+            (memory_access.address // page_size, memory_access.type)
+            for _, memory_access in trace_data.iter_chunk_memory_accesses(chunk)
+        )
+
+    def merge(self, other: TraceStatistics) -> None:
+        # `other` has to be collected from entries directly following the ones of this object
+        if other.entry_count == 0:
+            return
+        if self.last_isa_mode is not None and self.last_isa_mode != other.first_isa_mode:
+            self.isa_switch_counts[self.last_isa_mode, other.first_isa_mode] += 1
+        if self.first_isa_mode is None:
+            self.first_isa_mode = other.first_isa_mode
+        self.last_isa_mode = other.last_isa_mode
+        self.entry_count += other.entry_count
+        self.pc_counts.update(other.pc_counts)
+        self.instruction_length_counts.update(other.instruction_length_counts)
+        self.isa_switch_counts.update(other.isa_switch_counts)
+        self.memory_access_counts.update(other.memory_access_counts)
+
+    def format(self, triple_and_models: Iterable[str], top_count: int = DEFAULT_TOP_COUNT) -> str:
+        def percentage(count: int, total: int) -> str:
+            return f"{100 * count / total:.2f}%" if total else "-"
+
+        triple_and_models = tuple(triple_and_models)
+        lines = [f"Entries: {self.entry_count}"]
+
+        if self.pc_counts:
+            code_pages = {pc // self.page_size for pc in self.pc_counts}
+            lines.append(f"Unique PCs: {len(self.pc_counts)}, in {len(code_pages)} pages of 0x{self.page_size:X} bytes")
+            lines.append("Hottest PCs:")
+            for pc, count in self.pc_counts.most_common(top_count):
+                lines.append(f"  0x{pc:X}: {count} ({percentage(count, self.entry_count)})")
+
+        if self.instruction_length_counts:
+            lines.append("Instruction lengths:")
+            for length, count in sorted(self.instruction_length_counts.items()):
+                lines.append(f"  {length} bytes: {count} ({percentage(count, self.entry_count)})")
+
+        if len(triple_and_models) > 1:
+            lines.append(f"ISA switches: {sum(self.isa_switch_counts.values())}")
+            for (source, target), count in sorted(self.isa_switch_counts.items()):
+                lines.append(f"  {triple_and_models[source]} -> {triple_and_models[target]}: {count}")
+
+        if self.memory_access_counts:
+            counts_per_page: dict[int, Counter[MemoryAccessType]] = {}
+            counts_per_type: Counter[MemoryAccessType] = Counter()
+            for (page, access_type), count in self.memory_access_counts.items():
+                counts_per_page.setdefault(page, Counter())[access_type] += count
+                counts_per_type[access_type] += count
+            total = sum(counts_per_type.values())
+            lines.append(f"Memory accesses: {total}, in {len(counts_per_page)} pages of 0x{self.page_size:X} bytes")
+            for access_type, count in sorted(counts_per_type.items(), key=lambda item: item[0].value):
+                lines.append(f"  {access_type.name}: {count} ({percentage(count, total)})")
+            lines.append("Most accessed pages:")
+            hottest_pages = sorted(counts_per_page.items(), key=lambda item: (-sum(item[1].values()), item[0]))[:top_count]
+            for page, counts in hottest_pages:
+                details = ", ".join(f"{access_type.name}: {count}" for access_type, count in sorted(counts.items(), key=lambda item: item[0].value))
+                lines.append(f"  0x{page * self.page_size:X}: {sum(counts.values())} ({details})")
+
+        return "\n".join(lines)
+
+
+def collect_statistics(trace_data: TraceData, chunks: Iterable[TraceChunk], page_size: int = DEFAULT_PAGE_SIZE) -> TraceStatistics:
+    statistics = TraceStatistics(page_size)
+    for chunk in chunks:
+        statistics.update(trace_data, chunk)
+    return statistics
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2010-2025 Antmicro
+#
+# This file is licensed under the MIT License.
+# Full license text is available in 'licenses/MIT.txt'.
+#
+
+from execution_tracer.benchmark import main
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,11 @@
 # Full license text is available in 'licenses/MIT.txt'.
 #
 
-from typing import List
+import re
+from typing import Iterator, List, Optional, Union
 
-from execution_tracer.execution_tracer_reader import find_llvm_disas, read_file
+from execution_tracer.common_utils import parse_opcode_mask
+from execution_tracer.execution_tracer_reader import EntryFilter, find_llvm_disas, read_file
 
 
 def parse_binary_trace(
@@ -25,3 +27,85 @@ def parse_binary_trace(
         entries = [trace_data.format_entry(entry) for entry in trace_data]
 
     return entries
+
+
+# Keywords below stream the trace chunk by chunk and stop as soon as the result is known.
+# PCs and opcodes are compared on raw entries, only entries matched against a pattern are formatted.
+
+def _to_int(value: Union[str, int]) -> int:
+    return int(value, 0) if isinstance(value, str) else value
+
+
+def _iter_matching_entries(
+    path: str,
+    pattern: Optional[str],
+    pc: Optional[Union[str, int]],
+    opcode: Optional[Union[str, int]],
+    disassemble: bool,
+) -> Iterator[int]:
+    entry_filter = EntryFilter()
+    if pc is not None:
+        entry_filter.pc_range = (_to_int(pc), _to_int(pc) + 1)
+    if opcode is not None:
+        # Same format as the '--opcode-mask' option of the reader, e.g. 0x37/0x7F
+        entry_filter.opcode_mask = parse_opcode_mask(opcode) if isinstance(opcode, str) else (opcode, -1)
+    regex = None if pattern is None else re.compile(pattern)
+
+    llvm_disas_path = None
+    if disassemble and regex is not None:
+        llvm_disas_path = find_llvm_disas()
+
+    with open(path, "rb") as file:
+        trace_data = read_file(file, llvm_disas_path is not None, llvm_disas_path)
+        for chunk in trace_data.iter_chunks():
+            for i in trace_data.filter_chunk(chunk, entry_filter):
+                if regex is None or regex.search(trace_data.format_entry(trace_data.get_chunk_entry(chunk, i))):
+                    yield chunk.start_index + i
+
+
+def find_first_trace_entry(
+    path: str,
+    pattern: Optional[str] = None,
+    pc: Optional[Union[str, int]] = None,
+    opcode: Optional[Union[str, int]] = None,
+    disassemble: bool = False,
+) -> Optional[int]:
+    # Returns the index of the first entry matching all the given conditions or None if there isn't one.
+    # `pattern` is searched for in the entry formatted as by `parse_binary_trace`
+    entries = _iter_matching_entries(path, pattern, pc, opcode, disassemble)
+    try:
+        return next(entries, None)
+    finally:
+        entries.close()
+
+
+def count_trace_entries(
+    path: str,
+    pattern: Optional[str] = None,
+    pc: Optional[Union[str, int]] = None,
+    opcode: Optional[Union[str, int]] = None,
+    disassemble: bool = False,
+) -> int:
+    return sum(1 for _ in _iter_matching_entries(path, pattern, pc, opcode, disassemble))
+
+
+def trace_should_contain_pc_sequence(path: str, *pcs: Union[str, int]) -> None:
+    # PCs have to occur in the given order, but not necessarily one right after another
+    expected = [_to_int(pc) for pc in pcs]
+    found = 0
+    with open(path, "rb") as file:
+        trace_data = read_file(file, False, None)
+        if not trace_data.has_pc:
+            raise ValueError(f"Trace {path} doesn't contain PCs")
+        for chunk in trace_data.iter_chunks():
+            if found == len(expected):
+                break
+            for pc in chunk.pc:
+                if pc == expected[found]:
+                    found += 1
+                    if found == len(expected):
+                        break
+
+    if found < len(expected):
+        after = f" after 0x{expected[found - 1]:X}" if found > 0 else ""
+        raise AssertionError(f"PC 0x{expected[found]:X} (#{found + 1} in the sequence) wasn't found in the trace{after}")